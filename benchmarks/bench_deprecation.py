@@ -0,0 +1,268 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Microbenchmarks for the cost of using ``deprecation``
+
+Run from the root of the repository::
+
+    python benchmarks/bench_deprecation.py -o results.json
+
+Each benchmark reports the best and mean time per loop in nanoseconds.
+Pass ``--compare`` with a previous results file to print the change for
+each benchmark and exit non-zero if any got slower than ``--threshold``.
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import sys
+import timeit
+import types
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+import deprecation  # noqa: E402
+
+BENCHMARKS = []
+
+
+def benchmark(name):
+    """Register a function that returns the callable to time"""
+    def _register(make):
+        BENCHMARKS.append((name, make))
+        return make
+    return _register
+
+
+def _plain():
+    return 1
+
+
+def _documented():
+    """Summary line
+
+    Some more details about this function
+    that span a few lines.
+    """
+    return 1
+
+
+def _copy(function):
+    # Decorating rewrites __doc__ in place, so each decoration needs
+    # a fresh function object.
+    new = types.FunctionType(function.__code__, function.__globals__,
+                             function.__name__, function.__defaults__)
+    new.__doc__ = function.__doc__
+    return new
+
+
+def _deprecated_call(filter_action):
+    def make():
+        decorated = deprecation.deprecated(
+            deprecated_in="1.0", removed_in="3.0", current_version="2.0",
+            details="Use something else.")(_copy(_plain))
+        warnings.simplefilter(filter_action)
+
+        if filter_action == "error":
+            def call():
+                try:
+                    decorated()
+                except deprecation.DeprecatedWarning:
+                    pass
+            return call
+        return decorated
+    return make
+
+
+@benchmark("call_undecorated")
+def bench_call_undecorated():
+    return _plain
+
+
+@benchmark("call_not_yet_deprecated")
+def bench_call_not_yet_deprecated():
+    return deprecation.deprecated(deprecated_in="2.0", removed_in="3.0",
+                                  current_version="1.0")(_copy(_plain))
+
+
+benchmark("call_warn_always")(_deprecated_call("always"))
+benchmark("call_warn_ignored")(_deprecated_call("ignore"))
+benchmark("call_warn_error")(_deprecated_call("error"))
+
+
+@benchmark("call_emit_warnings_disabled")
+def bench_call_emit_warnings_disabled():
+    decorated = _deprecated_call("always")()
+    deprecation.emit_warnings = False
+    return decorated
+
+
+def _four_args(a, b, c, d=None):
+    return a
+
+
+def _positional_call(exact_signature):
+    def make():
+        decorated = deprecation.deprecated(
+            deprecated_in="2.0", removed_in="3.0", current_version="1.0",
+            exact_signature=exact_signature)(_copy(_four_args))
+
+        def call():
+            decorated(1, 2, 3, 4)
+        return call
+    return make
+
+
+benchmark("call_positional_args")(_positional_call(False))
+benchmark("call_positional_args_exact_signature")(_positional_call(True))
+
+
+@benchmark("decorate_exact_signature")
+def bench_decorate_exact_signature():
+    decorator = deprecation.deprecated(deprecated_in="1.0",
+                                       removed_in="3.0",
+                                       exact_signature=True)
+
+    def decorate():
+        decorator(_copy(_four_args))
+    return decorate
+
+
+@benchmark("parse_versions")
+def bench_parse_versions():
+    # Parsed versions are cached, so clear them to time parsing itself.
+    def parse():
+        deprecation._parse_version.cache_clear()
+        deprecation._version_state.cache_clear()
+        deprecation.deprecated(deprecated_in="1.0", removed_in="3.0",
+                               current_version="2.0")
+    return parse
+
+
+@benchmark("parse_versions_cached")
+def bench_parse_versions_cached():
+    def parse():
+        deprecation.deprecated(deprecated_in="1.0", removed_in="3.0",
+                               current_version="2.0")
+    return parse
+
+
+@benchmark("decorate_no_docstring")
+def bench_decorate_no_docstring():
+    decorator = deprecation.deprecated(deprecated_in="1.0",
+                                       removed_in="3.0")
+
+    def decorate():
+        decorator(_copy(_plain))
+    return decorate
+
+
+@benchmark("decorate_multiline_docstring")
+def bench_decorate_multiline_docstring():
+    decorator = deprecation.deprecated(deprecated_in="1.0",
+                                       removed_in="3.0")
+
+    def decorate():
+        decorator(_copy(_documented))
+    return decorate
+
+
+@benchmark("fail_if_not_removed_undecorated")
+def bench_fail_if_not_removed_undecorated():
+    return _deprecated_call("ignore")()
+
+
+@benchmark("fail_if_not_removed")
+def bench_fail_if_not_removed():
+    return deprecation.fail_if_not_removed(_deprecated_call("ignore")())
+
+
+def _time(function, repeat):
+    timer = timeit.Timer(function)
+    if hasattr(timer, "autorange"):
+        loops, _ = timer.autorange()
+    else:
+        loops = 10000
+    times = [t / loops * 1e9 for t in timer.repeat(repeat, loops)]
+    return {"loops": loops, "repeat": repeat,
+            "best_ns": min(times), "mean_ns": sum(times) / len(times)}
+
+
+def run(pattern=None, repeat=5):
+    results = {}
+    for name, make in BENCHMARKS:
+        if pattern and not re.search(pattern, name):
+            continue
+        # Each benchmark sets whatever global state it needs,
+        # so put things back afterwards.
+        emit_warnings = deprecation.emit_warnings
+        with warnings.catch_warnings():
+            warnings.showwarning = lambda *args, **kwargs: None
+            try:
+                results[name] = _time(make(), repeat)
+            finally:
+                deprecation.emit_warnings = emit_warnings
+    return {"python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "deprecation": deprecation.__version__,
+            "benchmarks": results}
+
+
+def compare(old, new, threshold):
+    """Print the change per benchmark, returning the names that regressed"""
+    regressed = []
+    for name, result in sorted(new["benchmarks"].items()):
+        previous = old["benchmarks"].get(name)
+        if previous is None:
+            continue
+        ratio = result["best_ns"] / previous["best_ns"]
+        print("%-35s %10.1f ns -> %10.1f ns  (%.2fx)" %
+              (name, previous["best_ns"], result["best_ns"], ratio))
+        if ratio > threshold:
+            regressed.append(name)
+    return regressed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-o", "--output",
+                        help="Write JSON results to this file")
+    parser.add_argument("-k", "--filter",
+                        help="Only run benchmarks matching this regex")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--compare",
+                        help="JSON results from a previous run to compare")
+    parser.add_argument("--threshold", type=float, default=1.2,
+                        help="Slowdown ratio counted as a regression")
+    args = parser.parse_args(argv)
+
+    results = run(args.filter, args.repeat)
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressed = compare(json.load(f), results, args.threshold)
+        if regressed:
+            print("Regressed: %s" % ", ".join(regressed))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
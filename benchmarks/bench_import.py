@@ -0,0 +1,95 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Benchmark how long ``import deprecation`` takes
+
+Run from the root of the repository::
+
+    python benchmarks/bench_import.py -o import.json
+
+Each run starts a fresh interpreter with ``-X importtime``, which needs
+Python 3.7+, and reports the best and mean cumulative import time of
+``deprecation``, including everything it imports that wasn't already
+loaded, in nanoseconds. The results have the same layout as
+``bench_deprecation.py`` and ``--compare`` works the same way.
+"""
+import argparse
+import json
+import os
+import platform
+import py_compile
+import subprocess
+import sys
+
+from bench_deprecation import compare
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _import_time(module):
+    """Return the cumulative import time of ``module`` in microseconds"""
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    output = subprocess.check_output(
+        [sys.executable, "-X", "importtime", "-c", "import " + module],
+        stderr=subprocess.STDOUT, env=env)
+    for line in output.decode().splitlines():
+        # import time: self [us] | cumulative | imported package
+        fields = line.split("|")
+        if len(fields) == 3 and fields[2].strip() == module:
+            return int(fields[1])
+    raise RuntimeError("no import time reported for %s" % module)
+
+
+def run(repeat=20):
+    # Time loading the bytecode rather than compiling the source, which
+    # would otherwise happen on every run when bytecode isn't written.
+    py_compile.compile(os.path.join(ROOT, "deprecation.py"))
+    times = [_import_time("deprecation") * 1e3 for _ in range(repeat)]
+    return {"python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "benchmarks": {"import_deprecation": {
+                "loops": 1, "repeat": repeat, "best_ns": min(times),
+                "mean_ns": sum(times) / len(times)}}}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-o", "--output",
+                        help="Write JSON results to this file")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--compare",
+                        help="JSON results from a previous run to compare")
+    parser.add_argument("--threshold", type=float, default=1.2,
+                        help="Slowdown ratio counted as a regression")
+    args = parser.parse_args(argv)
+
+    if sys.version_info < (3, 7):
+        parser.error("-X importtime needs Python 3.7+")
+
+    results = run(args.repeat)
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressed = compare(json.load(f), results, args.threshold)
+        if regressed:
+            print("Regressed: %s" % ", ".join(regressed))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
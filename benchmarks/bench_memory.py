@@ -0,0 +1,153 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Benchmark how much memory each deprecated function takes
+
+Run from the root of the repository::
+
+    python benchmarks/bench_memory.py -o memory.json
+
+Each benchmark deprecates a module of generated functions and reports
+the memory allocated per function in bytes, as measured by
+:mod:`tracemalloc`, which needs Python 3.4+. Pass ``--compare`` with a
+previous results file to print the change for each benchmark and exit
+non-zero if any grew by more than ``--threshold``.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+import deprecation  # noqa: E402
+
+FUNCTION = '''
+def function%d(a, b=None):
+    """Summary line
+
+    Some more details about this function.
+    """
+    return a
+'''
+
+
+def _module(functions):
+    module = types.ModuleType("legacy_module")
+    exec("".join(FUNCTION % i for i in range(functions)), vars(module))
+    return module
+
+
+def _decorate_each(module, functions):
+    for i in range(functions):
+        name = "function%d" % i
+        setattr(module, name, deprecation.deprecated(
+            deprecated_in="1.0", removed_in="2.0",
+            details="Use something else.")(getattr(module, name)))
+
+
+def _deprecate_module(module, functions):
+    deprecation.deprecate_module(module, deprecated_in="1.0",
+                                 removed_in="2.0",
+                                 details="Use something else.")
+
+
+def _deprecate_module_exact_signature(module, functions):
+    deprecation.deprecate_module(module, deprecated_in="1.0",
+                                 removed_in="2.0",
+                                 details="Use something else.",
+                                 exact_signature=True)
+
+
+BENCHMARKS = [("decorate_each", _decorate_each),
+              ("deprecate_module", _deprecate_module),
+              ("deprecate_module_exact_signature",
+               _deprecate_module_exact_signature)]
+
+
+def _measure(deprecate, functions):
+    import tracemalloc
+
+    module = _module(functions)
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        deprecate(module, functions)
+        used = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+    return {"functions": functions, "bytes_per_function": used / functions}
+
+
+def run(functions=300):
+    # Generated wrappers are created once for each signature, so don't
+    # count that towards the first benchmark that needs one.
+    _deprecate_module_exact_signature(_module(1), 1)
+    return {"python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "deprecation": deprecation.__version__,
+            "benchmarks": dict((name, _measure(deprecate, functions))
+                               for name, deprecate in BENCHMARKS)}
+
+
+def compare(old, new, threshold):
+    """Print the change per benchmark, returning the names that regressed"""
+    regressed = []
+    for name, result in sorted(new["benchmarks"].items()):
+        previous = old["benchmarks"].get(name)
+        if previous is None:
+            continue
+        ratio = (result["bytes_per_function"] /
+                 previous["bytes_per_function"])
+        print("%-35s %8.0f B -> %8.0f B  (%.2fx)" %
+              (name, previous["bytes_per_function"],
+               result["bytes_per_function"], ratio))
+        if ratio > threshold:
+            regressed.append(name)
+    return regressed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-o", "--output",
+                        help="Write JSON results to this file")
+    parser.add_argument("--functions", type=int, default=300)
+    parser.add_argument("--compare",
+                        help="JSON results from a previous run to compare")
+    parser.add_argument("--threshold", type=float, default=1.2,
+                        help="Growth ratio counted as a regression")
+    args = parser.parse_args(argv)
+
+    if sys.version_info < (3, 4):
+        parser.error("tracemalloc needs Python 3.4+")
+
+    results = run(args.functions)
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressed = compare(json.load(f), results, args.threshold)
+        if regressed:
+            print("Regressed: %s" % ", ".join(regressed))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
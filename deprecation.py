@@ -9,19 +9,34 @@
 # WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
 # License for the specific language governing permissions and limitations
 # under the License.
-import collections
 import functools
-import textwrap
+import itertools
+import os
+import sys
+import time
 import warnings
+import weakref
 
-from packaging import version
 from datetime import date
 
+try:
+    import contextvars
+except ImportError:
+    contextvars = None
+
 __version__ = "2.1.0"
 
 # This is mostly here so automodule docs are ordered more ideally.
-__all__ = ["deprecated", "message_location", "fail_if_not_removed",
-           "DeprecatedWarning", "UnsupportedWarning"]
+__all__ = ["deprecated", "message_location", "emit_warnings",
+           "fail_if_not_removed", "DeprecatedWarning", "UnsupportedWarning",
+           "fail_on_unsupported", "fail_on_unsupported_fixture",
+           "deprecated_params", "renamed_kwarg", "deprecate_attributes",
+           "usage", "reset_usage", "sample_callers", "caller_samples",
+           "Policy", "EveryNth", "TokenBucket", "add_sink", "remove_sink",
+           "JsonLinesHandler", "metrics", "serve_metrics", "share_counters",
+           "SharedCounters", "install_manifest", "ManifestFinder", "scan",
+           "find_callers", "ReleasePlan", "deprecate_module",
+           "deprecate_class"]
 
 #: Location where the details are added to a deprecated docstring
 #:
@@ -30,6 +45,17 @@ __all__ = ["deprecated", "message_location", "fail_if_not_removed",
 #: summary line and docstring contents.
 message_location = "bottom"
 
+#: Whether deprecated functions emit warnings when they're called
+#:
+#: When set to ``False``, every function wrapped by
+#: :func:`~deprecation.deprecated` becomes a passthrough to the original
+#: function, skipping warning creation and the :mod:`warnings` machinery
+#: entirely. This is checked on each call, so it can be toggled at any time
+#: and applies to functions that have already been decorated.
+#: It defaults to ``False`` when the ``DEPRECATION_DISABLE`` environment
+#: variable is set to a non-empty value.
+emit_warnings = not os.environ.get("DEPRECATION_DISABLE")
+
 
 class DeprecatedWarning(DeprecationWarning):
     """A warning class for deprecated methods
@@ -50,6 +76,12 @@ class DeprecatedWarning(DeprecationWarning):
                     of the now deprecated code.
     """
 
+    # The rendered message is cached on the instance, and deprecated
+    # functions share theirs between every warning they emit so that
+    # emitting a warning doesn't have to format it again.
+    __slots__ = ("function", "deprecated_in", "removed_in", "details",
+                 "_message")
+
     def __init__(self, function, deprecated_in, removed_in, details=""):
         # NOTE: The docstring only works for this class if it appears up
         # near the class name, not here inside __init__. I think it has
@@ -58,13 +90,19 @@ class DeprecatedWarning(DeprecationWarning):
         self.deprecated_in = deprecated_in
         self.removed_in = removed_in
         self.details = details
+        self._message = None
         super(DeprecatedWarning, self).__init__(function, deprecated_in,
                                                 removed_in, details)
 
     def __str__(self):
-        # Use a defaultdict to give us the empty string
-        # when a part isn't included.
-        parts = collections.defaultdict(str)
+        if self._message is None:
+            self._message = self._render()
+        return self._message
+
+    def _render(self):
+        # Parts that aren't included are left as the empty string.
+        parts = dict.fromkeys(("deprecated", "removed", "period",
+                               "details"), "")
         parts["function"] = self.function
 
         if self.deprecated_in:
@@ -91,10 +129,11 @@ class UnsupportedWarning(DeprecatedWarning):
     under test uses code that raises this warning.
     """
 
-    def __str__(self):
-        parts = collections.defaultdict(str)
-        parts["function"] = self.function
-        parts["removed"] = self.removed_in
+    __slots__ = ()
+
+    def _render(self):
+        parts = {"function": self.function, "removed": self.removed_in,
+                 "details": ""}
 
         if self.details:
             parts["details"] = " %s" % self.details
@@ -103,48 +142,355 @@ class UnsupportedWarning(DeprecatedWarning):
                 "%(details)s" % (parts))
 
 
-def deprecated(deprecated_in=None, removed_in=None, current_version=None,
-               details=""):
-    """Decorate a function to signify its deprecation
+_monotonic = getattr(time, "monotonic", time.time)
+_time = time.time
 
-    This function wraps a method that will soon be removed and does two things:
-        * The docstring of the method will be modified to include a notice
-          about deprecation, e.g., "Deprecated since 0.9.11. Use foo instead."
-        * Raises a :class:`~deprecation.DeprecatedWarning`
-          via the :mod:`warnings` module, which is a subclass of the built-in
-          :class:`DeprecationWarning`. Note that built-in
-          :class:`DeprecationWarning`s are ignored by default, so for users
-          to be informed of said warnings they will need to enable them--see
-          the :mod:`warnings` module documentation for more details.
 
-    :param deprecated_in: The version at which the decorated method is
-                          considered deprecated. This will usually be the
-                          next version to be released when the decorator is
-                          added. The default is **None**, which effectively
-                          means immediate deprecation. If this is not
-                          specified, then the `removed_in` and
-                          `current_version` arguments are ignored.
-    :param removed_in: The version or :class:`datetime.date` when the decorated
-                       method will be removed. The default is **None**,
-                       specifying that the function is not currently planned
-                       to be removed.
-                       Note: This parameter cannot be set to a value if
-                       `deprecated_in=None`.
-    :param current_version: The source of version information for the
-                            currently running code. This will usually be
-                            a `__version__` attribute on your library.
-                            The default is `None`.
-                            When `current_version=None` the automation to
-                            determine if the wrapped function is actually
-                            in a period of deprecation or time for removal
-                            does not work, causing a
-                            :class:`~deprecation.DeprecatedWarning`
-                            to be raised in all cases.
-    :param details: Extra details to be added to the method docstring and
-                    warning. For example, the details may point users to
-                    a replacement method, such as "Use the foo_bar
-                    method instead". By default there are no details.
+class Policy(object):
+    """Base class for warning emission policies
+
+    A policy decides whether a call to a deprecated function should go
+    through the :mod:`warnings` machinery. Each function wrapped by
+    :func:`~deprecation.deprecated` gets its own copy of the policy it was
+    given, so a single instance can be passed to any number of decorators.
+    Calls that a policy rejects skip warning creation entirely.
+    """
+
+    def copy(self):
+        """Return a fresh instance of this policy with no state"""
+        return type(self)()
+
+    def allow(self, caller):
+        """Return ``True`` if a warning should be emitted for this call
+
+        Subclasses must override this. Passing a policy that doesn't to
+        :func:`~deprecation.deprecated` raises :class:`TypeError`.
+
+        :param caller: The frame of the code that called the
+                       deprecated function.
+        """
+        raise NotImplementedError
+
+
+class _Once(Policy):
+    """Emit a warning on the first call only"""
+
+    def __init__(self):
+        self._done = False
+
+    def allow(self, caller):
+        if self._done:
+            return False
+        self._done = True
+        return True
+
+
+class _OncePerCallsite(Policy):
+    """Emit a warning on the first call from each call site"""
+
+    def __init__(self):
+        self._seen = set()
+
+    def allow(self, caller):
+        key = (caller.f_code, caller.f_lineno)
+        if key in self._seen:
+            return False
+        self._seen.add(key)
+        return True
+
+
+class EveryNth(Policy):
+    """Emit a warning on the first call and then on every ``n``th call
+
+    :param n: The number of calls per emitted warning.
+    """
+
+    def __init__(self, n):
+        if n < 1:
+            raise ValueError("n must be at least 1")
+        self.n = n
+        self._calls = 0
+
+    def copy(self):
+        return type(self)(self.n)
+
+    def allow(self, caller):
+        calls = self._calls
+        self._calls = calls + 1
+        return calls % self.n == 0
+
+
+class TokenBucket(Policy):
+    """Emit at most ``rate`` warnings per second, with bursts up to ``burst``
+
+    :param rate: The number of warnings per second to refill the
+                 bucket with.
+    :param burst: The most warnings that can be emitted at once.
+                  The default is **None**, which means ``rate``.
+    """
+
+    def __init__(self, rate, burst=None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.burst = rate if burst is None else burst
+        self._tokens = float(self.burst)
+        self._last = _monotonic()
+
+    def copy(self):
+        return type(self)(self.rate, self.burst)
+
+    def allow(self, caller):
+        now = _monotonic()
+        tokens = min(self.burst,
+                     self._tokens + (now - self._last) * self.rate)
+        self._last = now
+        if tokens < 1:
+            self._tokens = tokens
+            return False
+        self._tokens = tokens - 1
+        return True
+
+
+_POLICIES = {"once": _Once, "callsite": _OncePerCallsite}
+
+_base_allow = getattr(Policy.allow, "__func__", Policy.allow)
+
+
+def _make_policy(policy):
+    # "always" is represented by None so the wrapper can skip
+    # looking up the caller and calling into a policy.
+    if policy == "always":
+        return None
+    if isinstance(policy, Policy):
+        # Checked here so that a policy that can't decide anything fails
+        # when decorating rather than on the first call.
+        allow = type(policy).allow
+        if getattr(allow, "__func__", allow) is _base_allow:
+            raise TypeError("%s doesn't override Policy.allow()"
+                            % type(policy).__name__)
+        return policy.copy()
+    try:
+        return _POLICIES[policy]()
+    except (KeyError, TypeError):
+        raise ValueError("Unknown policy: %r" % (policy,))
+
+
+# The code object flag that identifies coroutine functions. This is
+# inspect.CO_COROUTINE, which isn't worth importing inspect for.
+_CO_COROUTINE = 0x80
+
+_can_mark_coroutines = sys.version_info >= (3, 12)
+
+# Before Python 3.12, a wrapper can only look like a coroutine function
+# to inspect and asyncio by being one, so it warns when the coroutine is
+# first awaited rather than when it's created. It's compiled the first
+# time it's needed since not every Python this module supports can
+# parse it.
+_COROUTINE_WRAPPER = """
+def make(function, record, should_warn):
+    counter = record._counter
+    async def _inner(*args, **kwargs):
+        calls = next(counter)
+        if _sample_every and not calls % _sample_every:
+            record.sample(2)
+        if should_warn and emit_warnings:
+            record.warn(2)
+        return await function(*args, **kwargs)
+    return _inner
+"""
+
+_coroutine_wrapper = []
+
+
+def _make_coroutine_wrapper(function, record, should_warn):
+    """Return an ``async def`` wrapper for the coroutine ``function``"""
+    if not _coroutine_wrapper:
+        namespace = {}
+        exec(_COROUTINE_WRAPPER, globals(), namespace)
+        _coroutine_wrapper.append(namespace["make"])
+    return _coroutine_wrapper[0](function, record, should_warn)
+
+
+_SIGNATURE_WRAPPER = """
+def make(_deprecation_function, _deprecation_record, _deprecation_should_warn,
+         _deprecation_next=next):
+    _deprecation_counter = _deprecation_record._counter
+    _deprecation_sample = _deprecation_record.sample
+    _deprecation_warn = _deprecation_record.warn
+    def _inner(%s):
+        _deprecation_calls = _deprecation_next(_deprecation_counter)
+        if _sample_every and not _deprecation_calls %% _sample_every:
+            _deprecation_sample(2)
+        if _deprecation_should_warn and emit_warnings:
+            _deprecation_warn(2)
+        return _deprecation_function(%s)
+    return _inner
+"""
+
+# Names the generated wrappers use, which parameters mustn't shadow.
+_SIGNATURE_RESERVED = frozenset(["_sample_every", "emit_warnings"])
+
+# Signature shape -> the factory for wrappers with that signature.
+_signature_wrappers = {}
+
+_CO_VARARGS = 0x04
+_CO_VARKEYWORDS = 0x08
+
+
+def _signature_shape(code, defaults, kwdefaults):
+    """Return what a wrapper needs to know to match ``code``'s parameters"""
+    names = code.co_varnames
+    positional = code.co_argcount
+    keyword_only = getattr(code, "co_kwonlyargcount", 0)
+    index = positional + keyword_only
+    varargs = varkw = None
+    if code.co_flags & _CO_VARARGS:
+        varargs = names[index]
+        index += 1
+    if code.co_flags & _CO_VARKEYWORDS:
+        varkw = names[index]
+    keyword_only = names[positional:positional + keyword_only]
+    return (getattr(code, "co_posonlyargcount", 0), names[:positional],
+            len(defaults or ()), varargs, keyword_only,
+            tuple(name in (kwdefaults or ()) for name in keyword_only),
+            varkw)
+
+
+def _signature_wrapper(shape):
+    """Return the factory for wrappers of a signature ``shape``, or None
+
+    The factory is generated the first time each shape is seen. Every
+    parameter is given a placeholder default if it has one, and the
+    wrapper's real defaults are copied from the function afterwards.
     """
+    try:
+        return _signature_wrappers[shape]
+    except KeyError:
+        pass
+    positional_only, positional, defaults, varargs, keyword_only, \
+        has_default, varkw = shape
+    names = set(positional + keyword_only) | set([varargs, varkw])
+    if names & _SIGNATURE_RESERVED or \
+            any(name and name.startswith("_deprecation_") for name in names):
+        factory = None
+    else:
+        parameters = []
+        first_default = len(positional) - defaults
+        for i, name in enumerate(positional):
+            if positional_only and i == positional_only:
+                parameters.append("/")
+            parameters.append(name + "=None" if i >= first_default else name)
+        if positional and positional_only == len(positional):
+            parameters.append("/")
+        if varargs:
+            parameters.append("*" + varargs)
+        elif keyword_only:
+            parameters.append("*")
+        parameters.extend(name + "=None" if default else name
+                          for name, default in zip(keyword_only,
+                                                   has_default))
+        if varkw:
+            parameters.append("**" + varkw)
+
+        arguments = list(positional)
+        if varargs:
+            arguments.append("*" + varargs)
+        arguments.extend("%s=%s" % (name, name) for name in keyword_only)
+        if varkw:
+            arguments.append("**" + varkw)
+
+        namespace = {}
+        try:
+            exec(_SIGNATURE_WRAPPER % (", ".join(parameters),
+                                       ", ".join(arguments)),
+                 globals(), namespace)
+        except SyntaxError:
+            # Such as Python 2's tuple parameters.
+            namespace["make"] = None
+        factory = namespace["make"]
+    _signature_wrappers[shape] = factory
+    return factory
+
+
+# Under -OO docstrings are stripped, so there is nothing to add to and
+# nobody reading them.
+_rewrite_docstrings = sys.flags.optimize < 2
+
+#: The most entries kept by each of the version parsing caches.
+_CACHE_SIZE = 1024
+
+
+def _memoize(function):
+    """Cache the results of ``function`` by its positional arguments
+
+    Libraries tend to pass the same ``__version__`` to every decorator
+    they apply, so results are shared across all decorations in the
+    process. The cache is cleared when it fills up to keep it bounded.
+    """
+    cache = {}
+
+    @functools.wraps(function)
+    def _cached(*args):
+        try:
+            return cache[args]
+        except KeyError:
+            pass
+        result = function(*args)
+        if len(cache) >= _CACHE_SIZE:
+            cache.clear()
+        cache[args] = result
+        return result
+    _cached.cache_clear = cache.clear
+    return _cached
+
+
+@_memoize
+def _parse_version(value):
+    # packaging takes longer to import than the rest of this module, and
+    # most versions don't need it, so it's imported on first use.
+    from packaging import version
+    return version.parse(value)
+
+
+def _parse_release(value):
+    """Parse a plain release version such as ``"1.2.3"``, or return None
+
+    These compare the same way as PEP 440 versions once trailing zeros are
+    dropped, as ``"1.0"`` and ``"1.0.0"`` are equal. Anything else, such
+    as pre-releases, is left to packaging.
+    """
+    if not isinstance(value, str):
+        return None
+    release = []
+    for part in value.split("."):
+        if not part or part.strip("0123456789"):
+            return None
+        release.append(int(part))
+    while len(release) > 1 and not release[-1]:
+        release.pop()
+    return tuple(release)
+
+
+@_memoize
+def _version_state(deprecated_in, removed_in, current_version):
+    """Return ``(is_deprecated, is_unsupported)`` for a version triple"""
+    parse = _parse_release
+    for value in (deprecated_in, removed_in, current_version):
+        if value and _parse_release(value) is None:
+            parse = _parse_version
+            break
+    current_version = parse(current_version)
+
+    if removed_in and current_version >= parse(removed_in):
+        return False, True
+    if deprecated_in and current_version >= parse(deprecated_in):
+        return True, False
+    return False, False
+
+
+def _deprecation_state(deprecated_in, removed_in, current_version):
+    """Return ``(is_deprecated, is_unsupported)`` as of right now"""
     # You can't just jump to removal. It's weird, unfair, and also makes
     # building up the docstring weird.
     if deprecated_in is None and removed_in is not None:
@@ -155,136 +501,2582 @@ def deprecated(deprecated_in=None, removed_in=None, current_version=None,
     # to add this decorator before a formal deprecation period begins.
     # In CPython, PendingDeprecatedWarning gets used in that period,
     # so perhaps mimick that at some point.
-    is_deprecated = False
-    is_unsupported = False
 
     # StrictVersion won't take a None or a "", so make whatever goes to it
     # is at least *something*. Compare versions only if removed_in is not
     # of type datetime.date
     if isinstance(removed_in, date):
         if date.today() >= removed_in:
-            is_unsupported = True
-        else:
-            is_deprecated = True
+            return False, True
+        return True, False
     elif current_version:
-        current_version = version.parse(current_version)
-
-        if (removed_in
-                and current_version >= version.parse(removed_in)):
-            is_unsupported = True
-        elif (deprecated_in
-              and current_version >= version.parse(deprecated_in)):
-            is_deprecated = True
+        return _version_state(deprecated_in, removed_in, current_version)
+
+    # If we can't actually calculate that we're in a period of
+    # deprecation...well, they used the decorator, so it's deprecated.
+    # This will cover the case of someone just using
+    # @deprecated("1.0") without the other advantages.
+    return True, False
+
+
+# Every live _Deprecation, for usage().
+_registry = weakref.WeakSet()
+
+
+def _records():
+    """Return a list of every live _Deprecation"""
+    # Deprecating a function on another thread while this one copies the
+    # set makes iterating it raise RuntimeError, so copy it again until
+    # nothing was added part way through. Registering a record only
+    # happens when decorating, so this rarely takes a second attempt.
+    while True:
+        try:
+            return list(_registry)
+        except RuntimeError:
+            pass
+
+
+# This module's namespace, which tells its frames apart from others.
+_globals = globals()
+
+
+def _caller(depth):
+    """Return the frame ``depth`` frames above the caller and its depth
+
+    Frames in this module are skipped, so when wrappers are stacked,
+    such as :func:`~deprecation.deprecated` over
+    :func:`~deprecation.renamed_kwarg`, warnings from the inner one are
+    attributed to the code that called the outer one, rather than to the
+    outer wrapper. This is what ``skip_file_prefixes`` does for
+    :func:`warnings.warn` on Python 3.12 and later, but it works here on
+    every version and without comparing file names.
+    """
+    depth += 1
+    frame = sys._getframe(depth)
+    while frame.f_globals is _globals and frame.f_back is not None:
+        frame = frame.f_back
+        depth += 1
+    return frame, depth - 1
+
+
+class _CallerFilter(object):
+    """Recognizes callers in the modules given to ``ignore_callers``
+
+    Whether a caller is ignored depends only on the module its code is
+    in, so the answer is cached for each code object, and looking it up
+    again is a dictionary lookup.
+    """
+
+    __slots__ = ("prefixes", "_ignored")
+
+    def __init__(self, prefixes):
+        self.prefixes = tuple(prefixes)
+        self._ignored = {}
+
+    def ignores(self, frame):
+        code = frame.f_code
+        # Code objects compare equal when their contents do, even if
+        # they're in different modules, so they're looked up by identity
+        # and kept alive so that their ids aren't reused.
+        try:
+            return self._ignored[id(code)][1]
+        except KeyError:
+            pass
+        module = frame.f_globals.get("__name__") or ""
+        ignored = any(module == prefix or module.startswith(prefix + ".")
+                      for prefix in self.prefixes)
+        # Don't let code that's generated at runtime fill up the cache.
+        if len(self._ignored) >= _CACHE_SIZE:
+            self._ignored.clear()
+        self._ignored[id(code)] = (code, ignored)
+        return ignored
+
+
+class _Deprecation(object):
+    """What's known about a deprecated function and how often it's called
+
+    One of these is created for each function wrapped by
+    :func:`~deprecation.deprecated`, and each name deprecated by
+    :func:`~deprecation.deprecate_attributes`. It handles everything the
+    wrapper does beyond calling the function.
+    """
+
+    __slots__ = ("name", "module", "qualname", "deprecated_in",
+                 "removed_in", "details", "is_deprecated", "is_unsupported",
+                 "policy", "ignore_callers", "warning_class", "_message",
+                 "_counter", "_offset", "_deadline", "__weakref__")
+
+    def __init__(self, name, module, qualname, deprecated_in, removed_in,
+                 details, is_deprecated, is_unsupported, policy,
+                 ignore_callers=None):
+        self.name = name
+        self.module = module
+        self.qualname = qualname
+        self.deprecated_in = deprecated_in
+        self.removed_in = removed_in
+        self.details = details
+        self.is_deprecated = is_deprecated
+        self.is_unsupported = is_unsupported
+        self.policy = policy
+        self.ignore_callers = ignore_callers
+        self.warning_class = UnsupportedWarning if is_unsupported \
+            else DeprecatedWarning
+        # The message is rendered the first time it's needed and shared
+        # with every warning after that, so functions that are never
+        # called never pay for it.
+        self._message = None
+        # Wrappers count calls with next(), which is the cheapest way to
+        # increment a counter that's safe to share between threads.
+        self._counter = itertools.count()
+        self._offset = 0
+        # When removal is planned for a date that hasn't come yet, this is
+        # when it will, as a timestamp. Checking it costs one float
+        # comparison against time.time() on the way to emitting a warning,
+        # instead of building a date on every call, so long-running
+        # processes still notice when the date passes.
+        self._deadline = None
+        if isinstance(removed_in, date) and not is_unsupported:
+            self._deadline = time.mktime(removed_in.timetuple())
+        _registry.add(self)
+
+    def _check_deadline(self):
+        if self._deadline is not None and _time() >= self._deadline:
+            self._deadline = None
+            self.is_deprecated = False
+            self.is_unsupported = True
+            self.warning_class = UnsupportedWarning
+            self._message = None
+
+    @property
+    def state(self):
+        self._check_deadline()
+        if self.is_unsupported:
+            return "unsupported"
+        if self.is_deprecated:
+            return "deprecated"
+        return "pending"
+
+    @property
+    def total(self):
+        # The only way to read an itertools.count without changing it.
+        return int(repr(self._counter)[6:-1])
+
+    @property
+    def calls(self):
+        return self.total - self._offset
+
+    def reset(self, calls=None):
+        self._offset += self.calls if calls is None else calls
+
+    def message(self):
+        if self._message is None:
+            self._message = str(self.warning_class(
+                self.name, self.deprecated_in, self.removed_in,
+                self.details))
+        return self._message
+
+    def warn(self, depth):
+        # depth is the number of frames between here and the code
+        # that called the deprecated function.
+        self._check_deadline()
+        if self.is_unsupported:
+            collected = _unsupported_calls.get()
+            if collected is not None:
+                collected.append(self.message())
+        caller, depth = _caller(depth)
+        if (self.ignore_callers is not None and
+                self.ignore_callers.ignores(caller)):
+            return
+        if self.policy is not None and not self.policy.allow(caller):
+            return
+        if _sinks:
+            event = self.event(caller)
+            for sink in _sinks:
+                sink(event)
+        the_warning = self.warning_class(self.name, self.deprecated_in,
+                                         self.removed_in, self.details)
+        the_warning._message = self.message()
+        warnings.warn(the_warning, category=DeprecationWarning,
+                      stacklevel=depth + 1)
+
+    def called(self, depth):
+        """Do everything a wrapper does when it's called"""
+        # Wrappers that need to be fast do this themselves.
+        calls = next(self._counter)
+        if _sample_every and not calls % _sample_every:
+            self.sample(depth + 1)
+        if (self.is_deprecated or self.is_unsupported) and emit_warnings:
+            self.warn(depth + 1)
+
+    def sample(self, depth):
+        caller, _ = _caller(depth)
+        code = caller.f_code
+        key = (self.module, self.qualname,
+               caller.f_globals.get("__name__"),
+               getattr(code, "co_qualname", code.co_name), caller.f_lineno)
+        samples = _caller_samples
+        if key in samples:
+            samples[key] += 1
+        elif len(samples) < _max_call_sites:
+            samples[key] = 1
+
+    def event(self, caller):
+        code = caller.f_code
+        return {"module": self.module, "qualname": self.qualname,
+                "deprecated_in": self.deprecated_in,
+                "removed_in": self.removed_in, "details": self.details,
+                "state": self.state,
+                "caller_module": caller.f_globals.get("__name__"),
+                "caller_qualname": getattr(code, "co_qualname",
+                                           code.co_name),
+                "caller_lineno": caller.f_lineno, "timestamp": _time()}
+
+    def as_dict(self):
+        return {"module": self.module, "qualname": self.qualname,
+                "deprecated_in": self.deprecated_in,
+                "removed_in": self.removed_in, "details": self.details,
+                "state": self.state, "calls": self.calls}
+
+
+def usage(reset=False):
+    """Return how often each deprecated function has been called
+
+    Every function wrapped by :func:`~deprecation.deprecated` counts its
+    calls, whether or not a warning is emitted, which makes this useful
+    for finding out which deprecated functions are still in use before
+    removing them. Counting doesn't involve the :mod:`warnings` module.
+
+    :param reset: Reset every count to zero after reading it.
+    :returns: A list of dictionaries, one per deprecated function, ordered
+              by ``module`` and ``qualname``. Each also contains the
+              ``deprecated_in``, ``removed_in`` and ``details`` given to
+              :func:`~deprecation.deprecated`, the ``state``, which is one
+              of ``"pending"``, ``"deprecated"`` or ``"unsupported"``, and
+              the number of ``calls``.
+    """
+    records = sorted(_records(),
+                     key=lambda r: (r.module or "", r.qualname))
+    snapshot = [record.as_dict() for record in records]
+    if reset:
+        # Only subtract what was read so calls made in
+        # the meantime aren't lost.
+        for record, entry in zip(records, snapshot):
+            record.reset(entry["calls"])
+    return snapshot
+
+
+def reset_usage():
+    """Reset the call count of every deprecated function to zero"""
+    for record in _records():
+        record.reset()
+
+
+_OPENMETRICS_CONTENT_TYPE = ("application/openmetrics-text; "
+                             "version=1.0.0; charset=utf-8")
+
+
+def _label_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, date):
+        value = value.isoformat()
+    return (str(value).replace("\\", "\\\\").replace("\n", "\\n")
+            .replace('"', '\\"'))
+
+
+_METRIC_LABELS = ("function", "deprecated_in", "removed_in", "state")
+
+
+def _metric_key(record):
+    """Return the values of _METRIC_LABELS for ``record`` as strings"""
+    function = "%s.%s" % (record.module, record.qualname) \
+        if record.module else record.qualname
+    removed_in = record.removed_in
+    if isinstance(removed_in, date):
+        removed_in = removed_in.isoformat()
+    return (function, "" if record.deprecated_in is None
+            else str(record.deprecated_in),
+            "" if removed_in is None else str(removed_in), record.state)
+
+
+def metrics():
+    """Return the call count of each deprecated function as OpenMetrics
+
+    This renders the same counts as :func:`~deprecation.usage` in the
+    `OpenMetrics <https://openmetrics.io/>`_ text format, which Prometheus
+    and compatible systems can scrape, as a counter named
+    ``deprecated_calls`` labelled with the ``function``, its
+    ``deprecated_in`` and ``removed_in``, and its ``state``. Counts are
+    read when this is called, so calling deprecated functions does no
+    extra work to keep them, and :func:`~deprecation.reset_usage`
+    doesn't affect them. After :func:`~deprecation.share_counters`, the
+    counts are those of every process sharing them.
+
+    See :func:`~deprecation.serve_metrics` to serve this over HTTP.
+
+    :returns: The metrics as a string, ending with ``# EOF``.
+    """
+    if _shared_counters is not None:
+        totals = _shared_counters.totals()
     else:
-        # If we can't actually calculate that we're in a period of
-        # deprecation...well, they used the decorator, so it's deprecated.
-        # This will cover the case of someone just using
-        # @deprecated("1.0") without the other advantages.
-        is_deprecated = True
+        totals = {}
+        for record in _records():
+            key = _metric_key(record)
+            totals[key] = totals.get(key, 0) + record.total
 
-    should_warn = any([is_deprecated, is_unsupported])
+    lines = ["# HELP deprecated_calls Calls to deprecated functions.",
+             "# TYPE deprecated_calls counter"]
+    for key, count in sorted(totals.items()):
+        labels = ",".join('%s="%s"' % (name, _label_value(value))
+                          for name, value in zip(_METRIC_LABELS, key))
+        lines.append("deprecated_calls_total{%s} %d" % (labels, count))
+    lines.append("# EOF\n")
+    return "\n".join(lines)
 
-    def _function_wrapper(function):
-        if should_warn:
-            # Everything *should* have a docstring, but just in case...
-            existing_docstring = function.__doc__ or ""
-
-            # The various parts of this decorator being optional makes for
-            # a number of ways the deprecation notice could go. The following
-            # makes for a nicely constructed sentence with or without any
-            # of the parts.
-
-            # If removed_in is a date, use "removed on"
-            # If removed_in is a version, use "removed in"
-            parts = {
-                "deprecated_in":
-                    " %s" % deprecated_in if deprecated_in else "",
-                "removed_in":
-                    "\n   This will be removed {} {}.".format("on" if isinstance(removed_in, date) else "in",
-                                                              removed_in) if removed_in else "",
-                "details":
-                    " %s" % details if details else ""}
-
-            deprecation_note = (".. deprecated::{deprecated_in}"
-                                "{removed_in}{details}".format(**parts))
-
-            # default location for insertion of deprecation note
-            loc = 1
-
-            # split docstring at first occurrence of newline
-            string_list = existing_docstring.split("\n", 1)
-
-            if len(string_list) > 1:
-                # With a multi-line docstring, when we modify
-                # existing_docstring to add our deprecation_note,
-                # if we're not careful we'll interfere with the
-                # indentation levels of the contents below the
-                # first line, or as PEP 257 calls it, the summary
-                # line. Since the summary line can start on the
-                # same line as the """, dedenting the whole thing
-                # won't help. Split the summary and contents up,
-                # dedent the contents independently, then join
-                # summary, dedent'ed contents, and our
-                # deprecation_note.
-
-                # in-place dedent docstring content
-                string_list[1] = textwrap.dedent(string_list[1])
-
-                # we need another newline
-                string_list.insert(loc, "\n")
-
-                # change the message_location if we add to end of docstring
-                # do this always if not "top"
-                if message_location != "top":
-                    loc = 3
-
-            # insert deprecation note and dual newline
-            string_list.insert(loc, deprecation_note)
-            string_list.insert(loc, "\n\n")
-
-            function.__doc__ = "".join(string_list)
 
-        @functools.wraps(function)
-        def _inner(*args, **kwargs):
-            if should_warn:
-                if is_unsupported:
-                    cls = UnsupportedWarning
-                else:
-                    cls = DeprecatedWarning
+# The SharedCounters metrics() reads from, if share_counters() was called.
+_shared_counters = None
 
-                the_warning = cls(function.__name__, deprecated_in,
-                                  removed_in, details)
-                warnings.warn(the_warning, category=DeprecationWarning,
-                              stacklevel=2)
+# Whether the exit and fork handlers for _shared_counters are registered.
+_publish_after_fork = False
 
-            return function(*args, **kwargs)
-        return _inner
-    return _function_wrapper
 
+def _after_fork_in_child():
+    if _shared_counters is not None:
+        _shared_counters._forked()
 
-def fail_if_not_removed(method):
-    """Decorate a test method to track removal of deprecated code
 
-    This decorator catches :class:`~deprecation.UnsupportedWarning`
-    warnings that occur during testing and causes unittests to fail,
-    making it easier to keep track of when code should be removed.
+def _publish_at_exit():
+    if _shared_counters is not None:
+        _shared_counters._stop.set()
+        _shared_counters.publish()
 
-    :raises: :class:`AssertionError` if an
-             :class:`~deprecation.UnsupportedWarning`
-             is raised while running the test method.
+
+class _FileLock(object):
+    # A lock shared between processes that the OS releases when the
+    # process holding it exits, however it exits. POSIX record locks
+    # belong to processes rather than file descriptors, so forked
+    # processes exclude each other even though they share the file, but
+    # threads in one process don't, so they also take a thread lock.
+
+    def __init__(self):
+        import fcntl
+        import tempfile
+
+        self._fcntl = fcntl
+        self._file = tempfile.TemporaryFile()
+        self._forked()
+
+    def _forked(self):
+        # Record locks aren't inherited, but a thread lock can be, held
+        # by a thread that doesn't exist in the child.
+        import threading
+        self._threads = threading.Lock()
+
+    def acquire(self, block=True, timeout=None):
+        # The same as multiprocessing.Lock.acquire(), which this stands in
+        # for: not blocking tries once, and no timeout waits as long as it
+        # takes.
+        if not block:
+            timeout = 0
+        deadline = None if timeout is None else _monotonic() + timeout
+        if sys.version_info >= (3,):
+            if not self._threads.acquire(
+                    True, -1 if timeout is None else timeout):
+                return False
+        elif not self._threads.acquire(block):
+            # Python 2's locks can't time out.
+            return False
+        while True:
+            try:
+                self._fcntl.lockf(self._file, self._fcntl.LOCK_EX |
+                                  self._fcntl.LOCK_NB)
+                return True
+            except (IOError, OSError):
+                if deadline is not None and _monotonic() >= deadline:
+                    self._threads.release()
+                    return False
+                time.sleep(0.001)
+
+    def release(self):
+        self._fcntl.lockf(self._file, self._fcntl.LOCK_UN)
+        self._threads.release()
+
+
+class SharedCounters(object):
+    """Call counts shared between processes through shared memory
+
+    Create these with :func:`~deprecation.share_counters`.
+
+    Counts live in an anonymous shared :mod:`mmap` of fixed size slots,
+    one for each distinct set of metric labels, which forked processes
+    inherit. Each process periodically adds the calls it has counted since
+    it last did so to the slots, so calling a deprecated function does no
+    more work than usual. Slots are found by hashing their labels and
+    claimed under a lock that's only held while publishing. Where
+    :mod:`fcntl` is available, it's a file lock that the OS releases if
+    the process holding it is killed, and otherwise a
+    :class:`multiprocessing.Lock`. Once every slot is taken, functions
+    that don't have one aren't counted.
     """
-    # NOTE(briancurtin): Unless this is named test_inner, nose won't work
-    # properly. See Issue #32.
-    @functools.wraps(method)
-    def test_inner(*args, **kwargs):
-        with warnings.catch_warnings(record=True) as caught_warnings:
-            warnings.simplefilter("always")
-            rv = method(*args, **kwargs)
 
-        for warning in caught_warnings:
-            if warning.category == UnsupportedWarning:
-                raise AssertionError(
-                    ("%s uses a function that should be removed: %s" %
-                     (method, str(warning.message))))
-        return rv
-    return test_inner
+    def __init__(self, slots, interval):
+        import mmap
+        import struct
+
+        # Each slot is the count, a CRC32 of the key, and as much of the
+        # key, the metric labels joined by tabs, as fits.
+        self._slot = struct.Struct("<QI244s")
+        self.slots = slots
+        self.interval = interval
+        self._memory = mmap.mmap(-1, slots * self._slot.size)
+        try:
+            self._lock = _FileLock()
+        except ImportError:
+            import multiprocessing
+            self._lock = multiprocessing.Lock()
+        # What's been published for each record, as (key, total), and
+        # where each key lives, for this process. Forked processes inherit
+        # these along with the counts they describe, so they carry on
+        # where their parent left off.
+        self._published = weakref.WeakKeyDictionary()
+        self._indexes = {}
+        self._stop = None
+        self._start()
+
+    def _start(self):
+        import threading
+
+        self._stop = threading.Event()
+        if self.interval:
+            thread = threading.Thread(target=self._run, args=(self._stop,),
+                                      name="deprecation-publish")
+            thread.daemon = True
+            thread.start()
+
+    def _forked(self):
+        # Calls counted before the fork are the parent's to publish, and
+        # threads don't survive fork, so start another one.
+        for record in _records():
+            self._published[record] = (None, record.total)
+        if isinstance(self._lock, _FileLock):
+            self._lock._forked()
+        self._start()
+
+    def _run(self, stop):
+        while not stop.wait(self.interval):
+            self.publish()
+
+    def _index(self, key):
+        """Return the slot for ``key``, claiming it if needed, or None"""
+        import zlib
+
+        index = self._indexes.get(key)
+        if index is not None:
+            return index
+        encoded = "\t".join(key).encode("utf-8")
+        crc = zlib.crc32(encoded) & 0xffffffff
+        name = encoded[:244]
+        for probe in range(self.slots):
+            index = (crc + probe) % self.slots
+            _, slot_crc, slot_name = self._slot.unpack_from(
+                self._memory, index * self._slot.size)
+            if slot_crc == crc and slot_name.rstrip(b"\0") == name:
+                break
+            if not slot_name.strip(b"\0"):
+                self._slot.pack_into(self._memory, index * self._slot.size,
+                                     0, crc, name)
+                break
+        else:
+            return None
+        self._indexes[key] = index
+        return index
+
+    def publish(self):
+        """Add the calls this process has counted since it last did so
+
+        This happens every ``interval`` seconds and when the process
+        exits, so it only needs calling when the interval is 0. Python 2
+        can't run code when a process forks, so there it should also be
+        called in the parent just before forking, and regularly in each
+        child.
+
+        :returns: False if the lock couldn't be acquired within a second,
+                  in which case the calls are added next time instead.
+        """
+        deltas = []
+        for record in _records():
+            total = record.total
+            key, published = self._published.get(record, (None, 0))
+            if total != published:
+                deltas.append((record, _metric_key(record), total,
+                               total - published))
+        if not deltas:
+            return True
+        # A process that's stopped while holding the lock mustn't stop
+        # every other one from carrying on.
+        if not self._lock.acquire(True, 1):
+            return False
+        try:
+            for record, key, total, delta in deltas:
+                index = self._index(key)
+                if index is not None:
+                    offset = index * self._slot.size
+                    count, crc, name = self._slot.unpack_from(self._memory,
+                                                              offset)
+                    self._slot.pack_into(self._memory, offset,
+                                         count + delta, crc, name)
+                self._published[record] = (key, total)
+        finally:
+            self._lock.release()
+        return True
+
+    def totals(self):
+        """Publish, then return the counts from every process
+
+        :returns: A dictionary from the values of the ``function``,
+                  ``deprecated_in``, ``removed_in`` and ``state`` labels
+                  of :func:`~deprecation.metrics` to the number of calls.
+        """
+        self.publish()
+        totals = {}
+        for index in range(self.slots):
+            count, _, name = self._slot.unpack_from(
+                self._memory, index * self._slot.size)
+            name = name.rstrip(b"\0")
+            if name:
+                key = tuple(name.decode("utf-8", "replace").split("\t"))
+                totals[key] = totals.get(key, 0) + count
+        return totals
+
+    def close(self):
+        """Stop publishing from this process"""
+        global _shared_counters
+        self._stop.set()
+        if _shared_counters is self:
+            _shared_counters = None
+
+
+def share_counters(slots=4096, interval=1.0):
+    """Share call counts with processes forked after this is called
+
+    Call this in the parent process of a pre-fork server, such as
+    gunicorn's ``--preload`` master, before workers are forked.
+    :func:`~deprecation.metrics` in any of them, including the parent,
+    then reports the calls made in all of them, including workers that
+    have since exited.
+
+    :param slots: The most distinct functions that can be counted. Each
+                  takes 256 bytes of shared memory.
+    :param interval: How often, in seconds, each process adds its counts
+                     to the shared ones, on a background thread. With 0,
+                     they're only added when
+                     :meth:`~deprecation.SharedCounters.publish` is called
+                     and at exit.
+    :returns: The :class:`~deprecation.SharedCounters`.
+    """
+    global _shared_counters, _publish_after_fork
+    if _shared_counters is not None:
+        _shared_counters.close()
+    _shared_counters = SharedCounters(slots, interval)
+    if not _publish_after_fork:
+        import atexit
+
+        atexit.register(_publish_at_exit)
+        # Threads don't survive fork, so start another one in the child.
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=_after_fork_in_child)
+        _publish_after_fork = True
+    return _shared_counters
+
+
+def serve_metrics(port, address=""):
+    """Serve :func:`~deprecation.metrics` over HTTP from a background thread
+
+    Every path responds with the metrics, so point a scraper at
+    ``http://<address>:<port>/metrics``.
+
+    :param port: The port to listen on, or 0 to pick a free one.
+    :param address: The address to listen on. All of them by default.
+    :returns: The server, from :mod:`http.server`. Its ``server_address``
+              says where it's listening, and its ``shutdown()`` method
+              stops it.
+    """
+    import threading
+    try:
+        from http.server import BaseHTTPRequestHandler, HTTPServer
+    except ImportError:
+        from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = metrics().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", _OPENMETRICS_CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer((address, port), MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever,
+                              name="deprecation-metrics")
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+# Every nth call to each deprecated function records its caller,
+# or none do when this is 0. See sample_callers().
+_sample_every = 0
+
+# The number of distinct call sites _caller_samples can hold.
+_max_call_sites = 1000
+
+# (module, qualname, caller module, caller qualname, caller lineno)
+# to the number of times that call was sampled.
+_caller_samples = {}
+
+
+def sample_callers(every=100, max_sites=1000):
+    """Start or stop recording who calls deprecated functions
+
+    Looking up the caller of every call would be too expensive to leave
+    on, so only one in ``every`` calls to each deprecated function is
+    sampled, starting with the first. Pass ``every=1`` to record every
+    call, or ``every=0`` to stop sampling.
+
+    :param every: Sample one in this many calls to each function.
+    :param max_sites: The most distinct call sites to keep samples for.
+                      Once this many have been seen, calls from new sites
+                      aren't recorded, but the sites already seen keep
+                      counting. This keeps memory bounded.
+    """
+    global _sample_every, _max_call_sites
+    if every < 0:
+        raise ValueError("every must not be negative")
+    _max_call_sites = max_sites
+    _sample_every = every
+
+
+def caller_samples(reset=False):
+    """Return the callers of deprecated functions seen by sampling
+
+    See :func:`~deprecation.sample_callers` to turn sampling on.
+
+    :param reset: Clear the samples after reading them.
+    :returns: A list of dictionaries, from most to least sampled, with the
+              ``module`` and ``qualname`` of the deprecated function,
+              the ``caller_module``, ``caller_qualname`` and
+              ``caller_lineno`` it was called from, and the number of
+              ``samples`` taken from that call site.
+    """
+    global _caller_samples
+    samples = _caller_samples
+    if reset:
+        _caller_samples = {}
+    samples = sorted(samples.items(), key=lambda item: -item[1])
+    return [{"module": key[0], "qualname": key[1], "caller_module": key[2],
+             "caller_qualname": key[3], "caller_lineno": key[4],
+             "samples": count}
+            for key, count in samples]
+
+
+# The callables given deprecation events. This is replaced rather than
+# changed in place, so warnings being emitted on other threads can loop
+# over it without a lock.
+_sinks = ()
+
+
+def add_sink(sink):
+    """Send a record of each deprecation warning to ``sink``
+
+    ``sink`` is called with a dictionary for every warning emitted,
+    after any :class:`~deprecation.Policy` has decided it should be, with
+    the ``module``, ``qualname``, ``deprecated_in``, ``removed_in``,
+    ``details`` and ``state`` of the deprecated function, the
+    ``caller_module``, ``caller_qualname`` and ``caller_lineno`` it was
+    called from, and a ``timestamp`` from :func:`time.time`.
+
+    Sinks are called on the thread that called the deprecated function, so
+    they should return quickly and not raise. To write records to a file
+    without blocking on I/O, use a :class:`~deprecation.JsonLinesHandler`.
+    Warnings are still emitted as usual; filter out
+    :class:`~deprecation.DeprecatedWarning` and
+    :class:`~deprecation.UnsupportedWarning` with :mod:`warnings` if the
+    sinks are all you need.
+
+    :param sink: A callable taking one argument.
+    """
+    global _sinks
+    _sinks = _sinks + (sink,)
+
+
+def remove_sink(sink):
+    """Stop sending deprecation records to ``sink``
+
+    :param sink: A callable previously given to
+                 :func:`~deprecation.add_sink`. Nothing happens if it
+                 isn't one of the current sinks.
+    """
+    global _sinks
+    _sinks = tuple(s for s in _sinks if s != sink)
+
+
+# Put on a JsonLinesHandler's queue to tell its thread to finish.
+_STOP = object()
+
+
+class JsonLinesHandler(object):
+    """A sink that writes deprecation records to a file as JSON Lines
+
+    Records are put on a bounded queue and written in batches by a
+    background thread, so the threads calling deprecated functions never
+    wait on the file. When the queue is full, records are dropped and
+    counted in :attr:`dropped` rather than waiting for room. Records that
+    can't be written, such as when the disk is full, are dropped and
+    counted too. The file is opened straight away, so a path that can't
+    be opened raises here.
+
+    ::
+
+        handler = deprecation.JsonLinesHandler("deprecations.jsonl")
+        deprecation.add_sink(handler)
+
+    :param path: The file to append records to.
+    :param max_queued: The most records to hold before dropping them.
+    :param batch_size: The most records to write at once.
+    """
+
+    def __init__(self, path, max_queued=10000, batch_size=256):
+        import threading
+        try:
+            import queue
+        except ImportError:
+            import Queue as queue
+
+        self.path = path
+        self.batch_size = batch_size
+        self._file = open(path, "a")
+        self._empty = queue.Empty
+        self._full = queue.Full
+        self._queue = queue.Queue(max_queued)
+        self._dropped = itertools.count()
+        self._thread = threading.Thread(target=self._run,
+                                        args=(self._queue,),
+                                        name="deprecation-jsonl")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def __call__(self, event):
+        try:
+            self._queue.put_nowait(event)
+        except self._full:
+            next(self._dropped)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def dropped(self):
+        """The number of records dropped because the queue was full or
+        they couldn't be written"""
+        return int(repr(self._dropped)[6:-1])
+
+    def flush(self):
+        """Wait until every record queued so far has been written"""
+        self._queue.join()
+
+    def close(self):
+        """Stop receiving records, write the ones queued, and close the file
+
+        The handler is removed from the sinks if it was added.
+        """
+        remove_sink(self)
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+        try:
+            self._file.close()
+        except (IOError, OSError):
+            # Closing writes out what's buffered, which only has records
+            # that failed to be written and have been counted as dropped.
+            pass
+
+    def _run(self, queue):
+        import json
+
+        f = self._file
+        while True:
+            # Wait for one record, then write whatever else has arrived
+            # along with it.
+            batch = [queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(queue.get_nowait())
+                except self._empty:
+                    break
+            events = [event for event in batch if event is not _STOP]
+            try:
+                f.write("".join(
+                    json.dumps(event, sort_keys=True, default=str) + "\n"
+                    for event in events))
+                f.flush()
+            except (IOError, OSError, ValueError):
+                # Such as a full disk. The thread carries on, so flush()
+                # and close() still return, and the next batch may fit.
+                for _ in events:
+                    next(self._dropped)
+            for _ in batch:
+                queue.task_done()
+            if len(events) < len(batch):
+                return
+
+
+def _add_deprecation_note(existing_docstring, deprecated_in, removed_in,
+                          details):
+    """Return ``existing_docstring`` with a deprecation note added to it"""
+    # Everything *should* have a docstring, but just in case...
+    existing_docstring = existing_docstring or ""
+
+    # The various parts of this decorator being optional makes for
+    # a number of ways the deprecation notice could go. The following
+    # makes for a nicely constructed sentence with or without any
+    # of the parts.
+
+    # If removed_in is a date, use "removed on"
+    # If removed_in is a version, use "removed in"
+    parts = {
+        "deprecated_in":
+            " %s" % deprecated_in if deprecated_in else "",
+        "removed_in":
+            "\n   This will be removed {} {}.".format("on" if isinstance(removed_in, date) else "in",
+                                                      removed_in) if removed_in else "",
+        "details":
+            " %s" % details if details else ""}
+
+    deprecation_note = (".. deprecated::{deprecated_in}"
+                        "{removed_in}{details}".format(**parts))
+
+    # default location for insertion of deprecation note
+    loc = 1
+
+    # split docstring at first occurrence of newline
+    string_list = existing_docstring.split("\n", 1)
+
+    if len(string_list) > 1:
+        # With a multi-line docstring, when we modify
+        # existing_docstring to add our deprecation_note,
+        # if we're not careful we'll interfere with the
+        # indentation levels of the contents below the
+        # first line, or as PEP 257 calls it, the summary
+        # line. Since the summary line can start on the
+        # same line as the """, dedenting the whole thing
+        # won't help. Split the summary and contents up,
+        # dedent the contents independently, then join
+        # summary, dedent'ed contents, and our
+        # deprecation_note.
+
+        # in-place dedent docstring content
+        import textwrap
+        string_list[1] = textwrap.dedent(string_list[1])
+
+        # we need another newline
+        string_list.insert(loc, "\n")
+
+        # change the message_location if we add to end of docstring
+        # do this always if not "top"
+        if message_location != "top":
+            loc = 3
+
+    # insert deprecation note and dual newline
+    string_list.insert(loc, deprecation_note)
+    string_list.insert(loc, "\n\n")
+
+    return "".join(string_list)
+
+
+def _wrap(function, record, should_warn, exact_signature=False):
+    """Return a wrapper that calls ``function`` on behalf of ``record``"""
+    counter = record._counter
+
+    code = getattr(function, "__code__", None)
+    flags = getattr(code, "co_flags", 0)
+    factory = None
+    if exact_signature and code is not None:
+        factory = _signature_wrapper(_signature_shape(
+            code, function.__defaults__,
+            getattr(function, "__kwdefaults__", None)))
+
+    # Other than coroutines before Python 3.12, generators, coroutines
+    # and asynchronous generators are returned by a regular function like
+    # any other value, so the warning is emitted when the function is
+    # called, and resuming them doesn't go through another frame.
+    if flags & _CO_COROUTINE and not _can_mark_coroutines:
+        _inner = _make_coroutine_wrapper(function, record, should_warn)
+    elif factory is not None:
+        _inner = factory(function, record, should_warn)
+        # It has placeholders for the function's defaults.
+        _inner.__defaults__ = function.__defaults__
+        if getattr(function, "__kwdefaults__", None):
+            _inner.__kwdefaults__ = dict(function.__kwdefaults__)
+    else:
+        # Only the counter is pulled out of the record ahead of time.
+        # Bound methods for the rest would be faster to call, but cost
+        # memory for every function, and they're only needed when the
+        # call goes on to warn, which costs far more than looking them up.
+        def _inner(*args, **kwargs):
+            calls = next(counter)
+            if _sample_every and not calls % _sample_every:
+                record.sample(2)
+            if should_warn and emit_warnings:
+                record.warn(2)
+            return function(*args, **kwargs)
+
+    if flags & _CO_COROUTINE and _can_mark_coroutines:
+        # The wrapper has to be marked in order for
+        # inspect.iscoroutinefunction to still recognize it.
+        import inspect
+        inspect.markcoroutinefunction(_inner)
+
+    _inner = functools.wraps(function)(_inner)
+    # Python 2's functools.wraps doesn't set this.
+    _inner.__wrapped__ = function
+    # This marks the wrapper as one of this module's, for
+    # deprecate_module and deprecate_class to leave alone.
+    _inner._deprecation = record
+    return _inner
+
+
+def _deprecate_class(cls, record, should_warn, docstring):
+    """Make ``cls`` warn when it's instantiated or subclassed"""
+    try:
+        cls.__doc__ = docstring
+    except (AttributeError, TypeError):
+        # Python 2 and extension types don't allow setting __doc__.
+        pass
+
+    if "__init__" in cls.__dict__:
+        cls.__init__ = _wrap(cls.__dict__["__init__"], record, should_warn)
+    else:
+        if cls.__init__ is object.__init__:
+            # object.__init__ complains about arguments once a class
+            # defines its own __init__, and it does nothing else.
+            def __init__(self, *args, **kwargs):
+                pass
+        else:
+            def __init__(self, *args, **kwargs):
+                init = super(cls, self).__init__
+                if getattr(init, "_deprecation", None) is not None:
+                    # A deprecated base class would warn as well, but
+                    # creating one instance should only warn once.
+                    init.__wrapped__(self, *args, **kwargs)
+                else:
+                    init(*args, **kwargs)
+        __init__.__qualname__ = "%s.__init__" % record.qualname
+        cls.__init__ = _wrap(__init__, record, should_warn)
+
+    if hasattr(cls, "__init_subclass__"):
+        # Python 3.6+ calls this when cls is subclassed. Like __init__,
+        # cls may have already defined its own.
+        original = cls.__dict__.get("__init_subclass__")
+
+        def __init_subclass__(subclass, **kwargs):
+            if should_warn and emit_warnings:
+                record.warn(2)
+            if original is not None:
+                original.__get__(None, subclass)(**kwargs)
+            else:
+                super(cls, subclass).__init_subclass__(**kwargs)
+        cls.__init_subclass__ = classmethod(__init_subclass__)
+    return cls
+
+
+class _DeprecatedProperty(property):
+    # A property whose accessors warn, including ones added later.
+    # The accessors are wrapped rather than the property so that attribute
+    # access still goes through the built-in property descriptor, which
+    # calls a single wrapper. This doesn't have a docstring since it would
+    # take the place of the property's own.
+
+    def __init__(self, record, should_warn, fget=None, fset=None,
+                 fdel=None, doc=None):
+        self._record = record
+        self._should_warn = should_warn
+        super(_DeprecatedProperty, self).__init__(
+            *[_wrap(f, record, should_warn) if f is not None else None
+              for f in (fget, fset, fdel)], doc=doc)
+        # Some versions of Python only store the doc of a property
+        # subclass when it came from fget.
+        self.__doc__ = doc
+
+    def _replace(self, fget, fset, fdel):
+        # Accessors that are already wrapped get wrapped again by
+        # __init__, so pass along what they wrap.
+        return type(self)(self._record, self._should_warn,
+                          *[getattr(f, "__wrapped__", f)
+                            for f in (fget, fset, fdel)], doc=self.__doc__)
+
+    def __set_name__(self, owner, name):
+        # Only called by Python 3.6+ when the property is assigned in a
+        # class body.
+        if self.fget is None:
+            self._record.name = name
+            self._record.qualname = "%s.%s" % (
+                getattr(owner, "__qualname__", owner.__name__), name)
+
+    def getter(self, fget):
+        return self._replace(fget, self.fset, self.fdel)
+
+    def setter(self, fset):
+        return self._replace(self.fget, fset, self.fdel)
+
+    def deleter(self, fdel):
+        return self._replace(self.fget, self.fset, fdel)
+
+
+def deprecated(deprecated_in=None, removed_in=None, current_version=None,
+               details="", policy="always", exact_signature=False,
+               ignore_callers=None):
+    """Decorate a function to signify its deprecation
+
+    This function wraps a method that will soon be removed and does two things:
+        * The docstring of the method will be modified to include a notice
+          about deprecation, e.g., "Deprecated since 0.9.11. Use foo instead."
+          This is skipped under ``python -OO``, which strips docstrings.
+        * Raises a :class:`~deprecation.DeprecatedWarning`
+          via the :mod:`warnings` module, which is a subclass of the built-in
+          :class:`DeprecationWarning`. Note that built-in
+          :class:`DeprecationWarning`s are ignored by default, so for users
+          to be informed of said warnings they will need to enable them--see
+          the :mod:`warnings` module documentation for more details.
+
+    Generators, coroutines and asynchronous generators emit the warning
+    when they're called, rather than each time they're resumed. Their
+    wrapper is a regular function that returns what the decorated function
+    does, so :func:`inspect.isgeneratorfunction` and
+    :func:`inspect.isasyncgenfunction` don't recognize it. Coroutine
+    functions are still recognized by :func:`inspect.iscoroutinefunction`
+    and :func:`asyncio.iscoroutinefunction`. Before Python 3.12, that
+    takes a wrapper that's itself a coroutine function, so they warn when
+    the coroutine is first awaited instead.
+
+    Classes, properties, class methods and static methods can also be
+    decorated. A class is modified in place to warn when it's instantiated
+    or subclassed, so :func:`isinstance` checks keep working. A property
+    warns when it's set, deleted or read from an instance, but not when
+    it's looked up on the class. It's named after its getter, or if it
+    has none, after the class attribute it's assigned to on Python 3.6+.
+
+    :param deprecated_in: The version at which the decorated method is
+                          considered deprecated. This will usually be the
+                          next version to be released when the decorator is
+                          added. The default is **None**, which effectively
+                          means immediate deprecation. If this is not
+                          specified, then the `removed_in` and
+                          `current_version` arguments are ignored.
+    :param removed_in: The version or :class:`datetime.date` when the decorated
+                       method will be removed. The default is **None**,
+                       specifying that the function is not currently planned
+                       to be removed.
+                       Note: This parameter cannot be set to a value if
+                       `deprecated_in=None`.
+    :param current_version: The source of version information for the
+                            currently running code. This will usually be
+                            a `__version__` attribute on your library.
+                            The default is `None`.
+                            When `current_version=None` the automation to
+                            determine if the wrapped function is actually
+                            in a period of deprecation or time for removal
+                            does not work, causing a
+                            :class:`~deprecation.DeprecatedWarning`
+                            to be raised in all cases.
+    :param details: Extra details to be added to the method docstring and
+                    warning. For example, the details may point users to
+                    a replacement method, such as "Use the foo_bar
+                    method instead". By default there are no details.
+    :param policy: How often calls emit a warning. ``"always"`` emits one
+                   on every call and is the default, leaving deduplication
+                   to the :mod:`warnings` filters. ``"once"`` emits only on
+                   the first call, and ``"callsite"`` emits on the first
+                   call from each call site. A :class:`~deprecation.Policy`
+                   instance such as :class:`~deprecation.EveryNth` or
+                   :class:`~deprecation.TokenBucket` may also be given.
+    :param exact_signature: Generate a wrapper with the same parameters as
+                            the decorated function, rather than one that
+                            takes ``*args, **kwargs``. Calls don't need
+                            their arguments packed and unpacked again,
+                            which makes them faster, particularly with
+                            positional arguments, and the wrapper's own
+                            ``__code__`` and ``__defaults__`` match the
+                            function's. Wrappers are generated once for
+                            each distinct parameter list. This applies to
+                            functions and methods, but not to classes or
+                            properties.
+    :param ignore_callers: Module names whose calls don't emit warnings,
+                           such as your own package's while it's still
+                           migrating away from the decorated function. A
+                           name also covers the modules within it, so
+                           ``["mypackage"]`` covers ``mypackage.utils``.
+                           Only the immediate caller is considered. Calls
+                           are still counted.
+    """
+    is_deprecated, is_unsupported = _deprecation_state(
+        deprecated_in, removed_in, current_version)
+    should_warn = is_deprecated or is_unsupported
+    policy = _make_policy(policy)
+    if ignore_callers is not None:
+        if isinstance(ignore_callers, str):
+            ignore_callers = [ignore_callers]
+        ignore_callers = _CallerFilter(ignore_callers)
+
+    def _function_wrapper(function):
+        if isinstance(function, (classmethod, staticmethod)):
+            return type(function)(_function_wrapper(function.__func__))
+
+        if isinstance(function, property):
+            accessors = [function.fget, function.fset, function.fdel]
+            present = [f for f in accessors if f is not None]
+            if not present:
+                raise TypeError("Can't deprecate a property without a "
+                                "getter, setter or deleter")
+            # A setter or deleter can be called anything, so without a
+            # getter this is only a placeholder until the property is
+            # assigned to a class and learns its own name.
+            named = present[0]
+        else:
+            named = function
+
+        # Each wrapped function keeps its own policy state.
+        record = _Deprecation(named.__name__,
+                              getattr(named, "__module__", None),
+                              getattr(named, "__qualname__", named.__name__),
+                              deprecated_in, removed_in, details,
+                              is_deprecated, is_unsupported,
+                              policy.copy() if policy is not None else None,
+                              ignore_callers)
+
+        docstring = function.__doc__
+        if should_warn and _rewrite_docstrings:
+            docstring = _add_deprecation_note(docstring, deprecated_in,
+                                              removed_in, details)
+
+        if isinstance(function, property):
+            return _DeprecatedProperty(record, should_warn, *accessors,
+                                       doc=docstring)
+
+        if isinstance(function, type):
+            return _deprecate_class(function, record, should_warn,
+                                    docstring)
+
+        function.__doc__ = docstring
+        return _wrap(function, record, should_warn, exact_signature)
+    return _function_wrapper
+
+
+def _parameter_records(function, names, deprecated_in, removed_in,
+                       details, state, policy):
+    """Return a _Deprecation for each of ``function``'s ``names``"""
+    is_deprecated, is_unsupported = state
+    qualname = getattr(function, "__qualname__", function.__name__)
+    return dict(
+        (name, _Deprecation("%s(%s=...)" % (function.__name__, name),
+                            getattr(function, "__module__", None),
+                            "%s(%s=...)" % (qualname, name),
+                            deprecated_in, removed_in, details,
+                            is_deprecated, is_unsupported,
+                            policy.copy() if policy is not None else None))
+        for name in names)
+
+
+def deprecated_params(names, deprecated_in=None, removed_in=None,
+                      current_version=None, details="", policy="always"):
+    """Decorate a function to signify the deprecation of some parameters
+
+    A warning is emitted when the decorated function is called with any of
+    the deprecated parameters, whether by keyword or by position, and is
+    otherwise called as usual. The work of finding out where each parameter
+    could be passed is done up front, so calls that don't use a deprecated
+    parameter only cost a length check and a set comparison. ::
+
+        @deprecation.deprecated_params("verbose", deprecated_in="1.0",
+                                       details="Use logging instead.")
+        def run(command, verbose=False):
+            ...
+
+    Docstrings are left alone.
+
+    :param names: A parameter name or a list of them.
+
+    The remaining parameters are the same as for
+    :func:`~deprecation.deprecated`.
+    """
+    if isinstance(names, str):
+        names = [names]
+    state = _deprecation_state(deprecated_in, removed_in, current_version)
+    policy = _make_policy(policy)
+
+    def _function_wrapper(function):
+        records = _parameter_records(function, names, deprecated_in,
+                                     removed_in, details, state, policy)
+
+        # Parameters that can be passed by position, with their index.
+        code = getattr(function, "__code__", None)
+        positional = code.co_varnames[:code.co_argcount] if code else ()
+        positions = [(positional.index(name), records[name])
+                     for name in names if name in positional]
+        # No number of positional arguments can reach a deprecated one
+        # when this is sys.maxsize.
+        first_position = min([i for i, _ in positions] or [sys.maxsize])
+        keywords = frozenset(names)
+
+        @functools.wraps(function)
+        def _inner(*args, **kwargs):
+            if len(args) > first_position or (
+                    kwargs and not keywords.isdisjoint(kwargs)):
+                for i, record in positions:
+                    if len(args) > i:
+                        record.called(2)
+                for name in keywords.intersection(kwargs):
+                    records[name].called(2)
+            return function(*args, **kwargs)
+        _inner.__wrapped__ = function
+        return _inner
+    return _function_wrapper
+
+
+def renamed_kwarg(old, new, deprecated_in=None, removed_in=None,
+                  current_version=None, details="", policy="always"):
+    """Decorate a function to signify that a keyword argument was renamed
+
+    When the decorated function is called with ``old`` as a keyword
+    argument, a warning is emitted and the value is passed to the function
+    as ``new`` instead. Calls that don't use ``old`` only cost a dictionary
+    lookup. ::
+
+        @deprecation.renamed_kwarg("timout", "timeout", deprecated_in="1.0")
+        def connect(host, timeout=None):
+            ...
+
+    Docstrings are left alone.
+
+    :param old: The name the keyword argument used to have.
+    :param new: The name the function now takes it as.
+    :param details: Extra details for the warning. By default they
+                    point users to ``new``.
+
+    The remaining parameters are the same as for
+    :func:`~deprecation.deprecated`.
+    """
+    details = details or "Use %s instead." % new
+    state = _deprecation_state(deprecated_in, removed_in, current_version)
+    policy = _make_policy(policy)
+
+    def _function_wrapper(function):
+        record = _parameter_records(function, [old], deprecated_in,
+                                    removed_in, details, state, policy)[old]
+
+        @functools.wraps(function)
+        def _inner(*args, **kwargs):
+            if old in kwargs:
+                record.called(2)
+                if new in kwargs:
+                    raise TypeError("%s() got values for both %r and %r" %
+                                    (function.__name__, old, new))
+                kwargs[new] = kwargs.pop(old)
+            return function(*args, **kwargs)
+        _inner.__wrapped__ = function
+        return _inner
+    return _function_wrapper
+
+
+def deprecate_attributes(module, attributes, deprecated_in=None,
+                         removed_in=None, current_version=None, details="",
+                         policy="always"):
+    """Deprecate names in a module, warning when they're accessed
+
+    This installs a module level ``__getattr__``, as described in
+    :pep:`562`, which emits a :class:`~deprecation.DeprecatedWarning` or
+    :class:`~deprecation.UnsupportedWarning` each time one of the
+    deprecated names is looked up on the module. Any ``__getattr__`` the
+    module already has is called for other names. It requires Python 3.7
+    or later. ::
+
+        deprecation.deprecate_attributes(
+            __name__, {"old_helpers": "mypackage.helpers",
+                       "OldClient": "mypackage.client:Client"},
+            deprecated_in="1.0", removed_in="2.0",
+            current_version=__version__,
+            details="Use mypackage.client.Client instead")
+
+    :param module: The module, or the name of the module, to deprecate
+                   names in. This will usually be ``__name__``.
+    :param attributes: Either a list of names that are already defined in
+                       the module, or a dictionary mapping each deprecated
+                       name to its value. String values are import paths,
+                       either ``"package.module"`` for a module or
+                       ``"package.module:name"`` for a name in a module,
+                       and aren't imported until the deprecated name is
+                       first accessed. Other values are used as they are.
+                       Deprecated names are removed from the module's
+                       namespace so that accessing them goes through
+                       ``__getattr__``.
+
+    The remaining parameters are the same as for
+    :func:`~deprecation.deprecated`.
+    """
+    if sys.version_info < (3, 7):
+        raise RuntimeError("deprecate_attributes requires Python 3.7+")
+
+    if isinstance(module, str):
+        module = sys.modules[module]
+    namespace = vars(module)
+    module_name = module.__name__
+
+    # Only values given in a dictionary can be import paths. Strings that
+    # are already in the module are used as they are.
+    lazy = isinstance(attributes, dict)
+    if not lazy:
+        attributes = dict((name, namespace[name]) for name in attributes)
+
+    is_deprecated, is_unsupported = _deprecation_state(
+        deprecated_in, removed_in, current_version)
+    policy = _make_policy(policy)
+
+    # name -> [record, value, whether value still needs to be imported]
+    entries = {}
+    for name, value in attributes.items():
+        record = _Deprecation(name, module_name, name, deprecated_in,
+                              removed_in, details, is_deprecated,
+                              is_unsupported,
+                              policy.copy() if policy is not None else None)
+        entries[name] = [record, value, lazy and isinstance(value, str)]
+        namespace.pop(name, None)
+
+    previous_getattr = namespace.get("__getattr__")
+    previous_dir = namespace.get("__dir__")
+
+    def __getattr__(name):
+        try:
+            entry = entries[name]
+        except KeyError:
+            if previous_getattr is not None:
+                return previous_getattr(name)
+            raise AttributeError("module %r has no attribute %r" %
+                                 (module_name, name))
+        entry[0].called(2)
+        if entry[2]:
+            entry[1] = _import_path(entry[1])
+            entry[2] = False
+        return entry[1]
+
+    def __dir__():
+        names = previous_dir() if previous_dir is not None else namespace
+        return sorted(set(names) | set(entries))
+
+    module.__getattr__ = __getattr__
+    module.__dir__ = __dir__
+
+
+def _is_deprecated(value):
+    """Return whether ``value`` has already been deprecated"""
+    if isinstance(value, _DeprecatedProperty):
+        return True
+    if isinstance(value, (classmethod, staticmethod)):
+        value = value.__func__
+    elif isinstance(value, type):
+        # Deprecated classes have their __init__ replaced.
+        value = vars(value).get("__init__")
+    return getattr(value, "_deprecation", None) is not None
+
+
+def _deprecate_members(owner, names, decorator, wrap):
+    """Replace each of ``owner``'s ``names`` for which ``wrap`` is true"""
+    namespace = vars(owner)
+    for name in names:
+        # Look in the namespace itself so class and static methods and
+        # properties come back as their descriptors.
+        value = namespace.get(name)
+        if value is not None and wrap(value) and not _is_deprecated(value):
+            setattr(owner, name, decorator(value))
+
+
+def deprecate_module(module, deprecated_in=None, removed_in=None,
+                     current_version=None, details="", policy="always",
+                     exact_signature=False, ignore_callers=None):
+    """Deprecate every public function and class in a module
+
+    This does the same as decorating each of them with
+    :func:`~deprecation.deprecated`, but in one call, which is handy for
+    a whole legacy module. Put it at the end of the module::
+
+        deprecation.deprecate_module(
+            __name__, deprecated_in="1.0", removed_in="2.0",
+            current_version=__version__,
+            details="Use mypackage.client instead")
+
+    The names in the module's ``__all__`` are deprecated, or if it doesn't
+    have one, every name that doesn't start with an underscore. Of those,
+    functions are replaced by wrappers in the module's namespace, and
+    classes are changed in place to warn when they're instantiated or
+    subclassed. Only functions and classes defined in the module or in a
+    module within it are deprecated, so that a package's implementation
+    can live in private submodules, and what's imported from other
+    packages isn't changed. Other values, and those that are already
+    deprecated, are left alone.
+
+    The versions are parsed once, and every function shares them along
+    with the other settings, so each one costs little more than its
+    wrapper and its own count of calls.
+
+    :param module: The module, or the name of the module, to deprecate.
+                   This will usually be ``__name__``.
+
+    The remaining parameters are the same as for
+    :func:`~deprecation.deprecated`.
+    """
+    if isinstance(module, str):
+        module = sys.modules[module]
+    module_name = module.__name__
+    names = getattr(module, "__all__", None)
+    if names is None:
+        names = [name for name in vars(module) if not name.startswith("_")]
+
+    def wrap(value):
+        if not (isinstance(value, type) or hasattr(value, "__code__")):
+            return False
+        defined_in = getattr(value, "__module__", None) or ""
+        return defined_in == module_name or \
+            defined_in.startswith(module_name + ".")
+
+    decorator = deprecated(deprecated_in, removed_in, current_version,
+                           details, policy, exact_signature, ignore_callers)
+    _deprecate_members(module, list(names), decorator, wrap)
+
+
+def deprecate_class(cls, deprecated_in=None, removed_in=None,
+                    current_version=None, details="", policy="always",
+                    exact_signature=False, ignore_callers=None):
+    """Deprecate every public method of a class
+
+    Methods, class methods, static methods and properties whose names
+    don't start with an underscore are replaced in place, as if each had
+    been decorated with :func:`~deprecation.deprecated`. Creating
+    instances of the class doesn't warn, so this suits classes that
+    should only lose some of their behaviour, or that are created for
+    their users. Decorate the class itself to warn about those too. ::
+
+        deprecation.deprecate_class(
+            LegacyClient, deprecated_in="1.0", removed_in="2.0",
+            current_version=__version__, details="Use Client instead")
+
+    Only what's defined in the class itself is deprecated, not what it
+    inherits, and what's already deprecated is left alone.
+
+    :param cls: The class to deprecate the methods of.
+
+    The remaining parameters are the same as for
+    :func:`~deprecation.deprecated`.
+    """
+    def wrap(value):
+        return isinstance(value, (classmethod, staticmethod, property)) or \
+            hasattr(value, "__code__")
+
+    decorator = deprecated(deprecated_in, removed_in, current_version,
+                           details, policy, exact_signature, ignore_callers)
+    _deprecate_members(cls, [name for name in vars(cls)
+                             if not name.startswith("_")], decorator, wrap)
+
+
+def _import_path(path):
+    """Import ``"package.module"`` or ``"package.module:name"``"""
+    import importlib
+
+    module_name, _, attribute = path.partition(":")
+    value = importlib.import_module(module_name)
+    for part in attribute.split(".") if attribute else []:
+        value = getattr(value, part)
+    return value
+
+
+# The arguments a manifest entry may give, besides removed_on.
+_MANIFEST_KEYS = ("deprecated_in", "removed_in", "current_version",
+                  "details", "policy")
+
+
+def _load_manifest(manifest):
+    """Return ``{module name: [entry]}`` from a manifest
+
+    Each entry is ``[path, module names, arguments]``. Without a colon,
+    any of a path's dotted prefixes could be its module, so the entry is
+    listed under each of them, and its module names are the ones it
+    hasn't been looked for in yet.
+    """
+    if not isinstance(manifest, dict):
+        if manifest.endswith(".toml"):
+            try:
+                import tomllib
+            except ImportError:
+                import tomli as tomllib
+            with open(manifest, "rb") as f:
+                manifest = tomllib.load(f)
+        else:
+            import json
+
+            with open(manifest) as f:
+                manifest = json.load(f)
+
+    index = {}
+    for path, arguments in manifest.items():
+        if ":" in path:
+            module_name, _, attribute = path.partition(":")
+            modules = [module_name]
+            names = module_name.split(".") + attribute.split(".")
+        else:
+            names = path.split(".")
+            modules = [".".join(names[:i]) for i in range(1, len(names))]
+        if not modules or not all(names):
+            raise ValueError("%r isn't a path to a name in a module" % path)
+
+        arguments = dict(arguments)
+        removed_on = arguments.pop("removed_on", None)
+        unknown = set(arguments) - set(_MANIFEST_KEYS)
+        if unknown:
+            raise ValueError("unknown keys for %r: %s"
+                             % (path, ", ".join(sorted(unknown))))
+        if removed_on is not None:
+            if "removed_in" in arguments:
+                raise ValueError("%r has both removed_in and removed_on"
+                                 % path)
+            if not isinstance(removed_on, date):
+                removed_on = date(*[int(part)
+                                    for part in removed_on.split("-")])
+            arguments["removed_in"] = removed_on
+        # Check the versions now rather than when the module is imported.
+        _deprecation_state(arguments.get("deprecated_in"),
+                           arguments.get("removed_in"), None)
+        entry = [path, set(modules), arguments]
+        for module_name in modules:
+            index.setdefault(module_name, []).append(entry)
+    return index
+
+
+class _ManifestLoader(object):
+    """Wraps a module's loader to deprecate names once the module runs"""
+
+    def __init__(self, loader, finder):
+        self._loader = loader
+        self._finder = finder
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+    def create_module(self, spec):
+        create_module = getattr(self._loader, "create_module", None)
+        return create_module(spec) if create_module is not None else None
+
+    def exec_module(self, module):
+        self._loader.exec_module(module)
+        self._finder.apply(module)
+
+
+class ManifestFinder(object):
+    """An import hook that deprecates names listed in a manifest
+
+    Create these with :func:`~deprecation.install_manifest`.
+    """
+
+    def __init__(self, index, current_version):
+        self._index = index
+        self._current_version = current_version
+
+    def find_spec(self, fullname, path, target=None):
+        # This is called for every import, so the common case of a module
+        # that isn't in the manifest has to be quick.
+        if fullname not in self._index:
+            return None
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                if spec.loader is not None and \
+                        hasattr(spec.loader, "exec_module"):
+                    spec.loader = _ManifestLoader(spec.loader, self)
+                return spec
+        return None
+
+    def apply(self, module):
+        """Deprecate the names the manifest lists in ``module``"""
+        for entry in self._index.pop(module.__name__, []):
+            path, modules, arguments = entry
+            if module.__name__ not in modules:
+                # It's been found in another module already.
+                continue
+            modules.discard(module.__name__)
+            arguments = dict(arguments)
+            arguments.setdefault("current_version", self._current_version)
+            attribute = path[len(module.__name__) + 1:]
+            parts = attribute.split(".")
+            if modules and not hasattr(module, parts[0]):
+                # It may be in a submodule that hasn't been imported yet.
+                continue
+            modules.clear()
+            owner = module
+            try:
+                for part in parts[:-1]:
+                    owner = getattr(owner, part)
+                # Look in the namespace itself so class and static methods
+                # and properties come back as their descriptors.
+                value = vars(owner)[parts[-1]]
+            except (AttributeError, KeyError, TypeError):
+                warnings.warn("%s has no attribute %s to deprecate"
+                              % (module.__name__, attribute), RuntimeWarning)
+                continue
+            if owner is module and not callable(value):
+                deprecate_attributes(module, [parts[-1]], **arguments)
+            else:
+                setattr(owner, parts[-1], deprecated(**arguments)(value))
+
+    def uninstall(self):
+        """Stop deprecating names in modules imported from now on
+
+        Entries that haven't been applied by then are reported with a
+        :class:`RuntimeWarning`.
+        """
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+        unapplied = set(path for entries in self._index.values()
+                        for path, modules, _ in entries if modules)
+        self._index = {}
+        if unapplied:
+            warnings.warn("manifest entries were never applied: %s"
+                          % ", ".join(sorted(unapplied)), RuntimeWarning)
+
+
+def install_manifest(manifest, current_version=None):
+    """Deprecate the names listed in a manifest as their modules load
+
+    Rather than decorating each deprecated function, list them in a JSON
+    or TOML file, mapping the path to each, such as
+    ``"package.module:function"`` or ``"package.module:Class.method"``, to
+    the arguments :func:`~deprecation.deprecated` would be given. In place
+    of a ``removed_in`` date, give ``removed_on`` as ``"YYYY-MM-DD"``, or
+    as a date in TOML. Paths can also be written with only dots, such as
+    ``"package.module.Class.method"``, in which case the name is looked
+    for in each module along the path as it's imported. ::
+
+        {"mypackage.helpers:old_helper": {"deprecated_in": "1.0",
+                                          "removed_in": "2.0",
+                                          "details": "Use new_helper"},
+         "mypackage.client:Client.connect": {"deprecated_in": "1.2"}}
+
+    The manifest is read once, and an import hook deprecates the names in
+    each module right after it's first imported. Only modules named in
+    the manifest are touched; other imports only cost a dictionary
+    lookup. Modules that are already imported are updated immediately.
+    Functions, classes, methods and properties are wrapped as by
+    :func:`~deprecation.deprecated`. Other names at the top of a module
+    are deprecated with :func:`~deprecation.deprecate_attributes`. Names
+    that can't be found are reported with a :class:`RuntimeWarning`, as
+    are entries that still haven't been applied when the finder's
+    ``uninstall()`` method is called.
+    This requires Python 3.4 or later, and TOML requires Python 3.11 or
+    the ``tomli`` package.
+
+    :param manifest: The path of a ``.json`` or ``.toml`` file, or the
+                     dictionary it would contain.
+    :param current_version: The ``current_version`` for entries that don't
+                            give their own.
+    :returns: The :class:`~deprecation.ManifestFinder` installed in
+              :data:`sys.meta_path`. Call its ``uninstall()`` method to
+              remove it.
+    """
+    if sys.version_info < (3, 4):
+        raise RuntimeError("install_manifest requires Python 3.4+")
+
+    finder = ManifestFinder(_load_manifest(manifest), current_version)
+    for module_name in list(finder._index):
+        if module_name in sys.modules:
+            finder.apply(sys.modules[module_name])
+    sys.meta_path.insert(0, finder)
+    return finder
+
+
+def fail_if_not_removed(method):
+    """Decorate a test method to track removal of deprecated code
+
+    This decorator catches :class:`~deprecation.UnsupportedWarning`
+    warnings that occur during testing and causes unittests to fail,
+    making it easier to keep track of when code should be removed.
+
+    :raises: :class:`AssertionError` if an
+             :class:`~deprecation.UnsupportedWarning`
+             is raised while running the test method.
+    """
+    # NOTE(briancurtin): Unless this is named test_inner, nose won't work
+    # properly. See Issue #32.
+    @functools.wraps(method)
+    def test_inner(*args, **kwargs):
+        with warnings.catch_warnings(record=True) as caught_warnings:
+            warnings.simplefilter("always")
+            rv = method(*args, **kwargs)
+
+        for warning in caught_warnings:
+            if warning.category == UnsupportedWarning:
+                raise AssertionError(
+                    ("%s uses a function that should be removed: %s" %
+                     (method, str(warning.message))))
+        return rv
+    return test_inner
+
+
+class _ThreadLocalVar(object):
+    """A stand-in for :class:`contextvars.ContextVar` before Python 3.7"""
+
+    def __init__(self):
+        import threading
+        self._local = threading.local()
+
+    def get(self):
+        return getattr(self._local, "value", None)
+
+    def set(self, value):
+        token = self.get()
+        self._local.value = value
+        return token
+
+    def reset(self, token):
+        self._local.value = token
+
+
+# The list that calls to unsupported functions are collected into
+# for the innermost active fail_on_unsupported, if there is one.
+if contextvars is not None:
+    _unsupported_calls = contextvars.ContextVar("unsupported_calls",
+                                                default=None)
+else:
+    _unsupported_calls = _ThreadLocalVar()
+
+
+class _UnsupportedCallCollector(object):
+
+    def __init__(self, label="Code"):
+        self.label = label
+        self.messages = None
+        self._token = None
+
+    def __enter__(self):
+        self.messages = []
+        self._token = _unsupported_calls.set(self.messages)
+        return self.messages
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _unsupported_calls.reset(self._token)
+        if exc_type is None and self.messages:
+            raise AssertionError(
+                ("%s uses a function that should be removed: %s" %
+                 (self.label, self.messages[0])))
+
+    def __call__(self, method):
+        # NOTE: Named test_inner for nose, just like fail_if_not_removed.
+        @functools.wraps(method)
+        def test_inner(*args, **kwargs):
+            with _UnsupportedCallCollector(method):
+                return method(*args, **kwargs)
+        return test_inner
+
+
+def fail_on_unsupported(method=None):
+    """Fail if code calls a function that should be removed
+
+    This is an alternative to :func:`~deprecation.fail_if_not_removed`
+    that doesn't touch the global :mod:`warnings` state. Instead, functions
+    wrapped by :func:`~deprecation.deprecated` report calls made while
+    they're unsupported directly to the innermost active
+    :func:`~deprecation.fail_on_unsupported` in the same thread or
+    :mod:`asyncio` task, making it safe to use in tests that run
+    concurrently. Only unsupported calls are collected, and they are
+    collected regardless of :mod:`warnings` filters or the ``policy``
+    given to :func:`~deprecation.deprecated`, though not while
+    :data:`~deprecation.emit_warnings` is ``False``.
+
+    It can decorate a test method, with or without parentheses::
+
+        @deprecation.fail_on_unsupported
+        def test_won(self):
+            self.assertEqual(1, won())
+
+    Or be used as a context manager, which gives a list of the messages
+    collected so far::
+
+        with deprecation.fail_on_unsupported() as messages:
+            won()
+
+    Code running in threads started inside of it is not tracked.
+    See :func:`~deprecation.fail_on_unsupported_fixture` for use
+    with pytest.
+
+    :raises: :class:`AssertionError` if a function that should be removed
+             is called while running the test method or ``with`` block.
+    """
+    if method is None:
+        return _UnsupportedCallCollector()
+    return _UnsupportedCallCollector()(method)
+
+
+def fail_on_unsupported_fixture():
+    """A generator to make a pytest fixture of fail_on_unsupported
+
+    This module doesn't depend on pytest, so it needs to be turned
+    into a fixture in your ``conftest.py``::
+
+        import deprecation
+        import pytest
+
+        fail_on_unsupported = pytest.fixture(
+            deprecation.fail_on_unsupported_fixture)
+
+    Tests that request the ``fail_on_unsupported`` fixture then fail if
+    they call a function that should be removed, and can inspect the
+    list of messages collected so far.
+    """
+    with _UnsupportedCallCollector("Test") as messages:
+        yield messages
+
+
+# Where the command line keeps what scan() and find_callers() found in
+# each file, unless told otherwise, and the layout of what's kept there.
+_SCAN_CACHE_FILE = ".deprecation-cache.json"
+_SCAN_CACHE_FORMAT = 2
+
+_SCAN_FIELDS = ["file", "line", "qualname", "kind", "deprecated_in",
+                "removed_in", "removed_on", "details", "current_version",
+                "state"]
+
+_CALLER_FIELDS = ["symbol", "deprecated_in", "removed_in", "removed_on",
+                  "state", "file", "line", "scope"]
+
+_PLAN_FIELDS = ["file", "line", "qualname", "deprecated_in", "removed_in",
+                "removed_on", "before", "after"]
+
+
+def _python_files(paths):
+    """Yield every Python source file in ``paths``"""
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs[:] = sorted(d for d in dirs
+                             if not d.startswith(".") and d != "__pycache__")
+            for name in sorted(files):
+                if name.endswith(".py"):
+                    yield os.path.join(root, name)
+
+
+def _imported_name(node, alias):
+    """Return the dotted name ``alias`` imports in the statement ``node``
+
+    Relative imports keep their leading dots, as they can only be resolved
+    once the importing module's name is known.
+    """
+    if node.__class__.__name__ == "Import":
+        return alias.name if alias.asname else alias.name.split(".")[0]
+    base = "." * (node.level or 0) + (node.module or "")
+    if node.module:
+        return base + "." + alias.name
+    return base + alias.name
+
+
+def _imported_names(nodes):
+    """Return what each name bound by an import in ``nodes`` refers to"""
+    import ast
+
+    names = {}
+    for node in nodes:
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            for alias in node.names:
+                if alias.name != "*":
+                    bound = (alias.asname or alias.name).split(".")[0]
+                    names[bound] = _imported_name(node, alias)
+    return names
+
+
+def _literal(node, names):
+    """Return ``(value, True)`` for a literal ``node``, else ``(None, False)``
+
+    Besides plain literals this understands ``date(y, m, d)`` and
+    module-level names in ``names`` that were assigned literals.
+    """
+    import ast
+
+    try:
+        return ast.literal_eval(node), True
+    except ValueError:
+        pass
+    if isinstance(node, ast.Name) and node.id in names:
+        return names[node.id], True
+    if isinstance(node, ast.Call) and not node.keywords:
+        func = node.func
+        name = func.attr if isinstance(func, ast.Attribute) else \
+            getattr(func, "id", None)
+        if name == "date":
+            try:
+                return date(*[ast.literal_eval(arg)
+                              for arg in node.args]), True
+            except (ValueError, TypeError):
+                pass
+    return None, False
+
+
+def _scan_source(source, filename):
+    """Index what ``source`` deprecates and what it refers to
+
+    Returns a dictionary with an entry for each deprecated() decoration in
+    ``entries``, every ``[dotted name, line, scope]`` reached through an
+    import or a top-level definition in ``references``, and the names
+    imported at the top level, which others may import from here, in
+    ``aliases``. Names defined in ``source`` itself start with ``:``.
+    """
+    import ast
+
+    tree = ast.parse(source, filename)
+    aliases = _imported_names(tree.body)
+    bindings = _imported_names(ast.walk(tree))
+    modules = set(name for name, target in bindings.items()
+                  if target == "deprecation")
+    functions = set(name for name, target in bindings.items()
+                    if target == "deprecation.deprecated")
+
+    # Module-level literals such as __version__ that decorators refer to.
+    names = {}
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and len(node.targets) == 1 and \
+                isinstance(node.targets[0], ast.Name):
+            value, resolved = _literal(node.value, {})
+            if resolved:
+                names[node.targets[0].id] = value
+        elif node.__class__.__name__ in ("FunctionDef", "ClassDef",
+                                         "AsyncFunctionDef"):
+            bindings[node.name] = ":" + node.name
+
+    def reference(node):
+        attributes = []
+        while isinstance(node, ast.Attribute):
+            attributes.append(node.attr)
+            node = node.value
+        if isinstance(node, ast.Name) and node.id in bindings:
+            return ".".join([bindings[node.id]] + attributes[::-1])
+        return None
+
+    def is_deprecated_call(decorator):
+        if not isinstance(decorator, ast.Call):
+            return False
+        func = decorator.func
+        if isinstance(func, ast.Name):
+            return func.id in functions
+        return (isinstance(func, ast.Attribute) and
+                func.attr == "deprecated" and
+                isinstance(func.value, ast.Name) and
+                func.value.id in modules)
+
+    definitions = (ast.FunctionDef, ast.ClassDef,
+                   getattr(ast, "AsyncFunctionDef", ast.FunctionDef))
+    parameters = ["deprecated_in", "removed_in", "current_version",
+                  "details"]
+    entries = []
+    references = set()
+
+    def visit(node, scope):
+        # What references are made from: a function, class or the module.
+        where = ".".join(scope[:-1] if scope[-1:] == ["<locals>"]
+                         else scope) or "<module>"
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, (ast.Name, ast.Attribute)):
+                name = reference(child)
+                if name is not None:
+                    references.add((name, child.lineno, where))
+                    continue
+            elif isinstance(child, ast.ImportFrom):
+                for alias in child.names:
+                    references.add((_imported_name(child, alias),
+                                    child.lineno, where))
+            if not isinstance(child, definitions):
+                visit(child, scope)
+                continue
+            qualname = ".".join(scope + [child.name])
+            for decorator in child.decorator_list:
+                if not is_deprecated_call(decorator):
+                    continue
+                arguments = dict(zip(parameters, decorator.args))
+                arguments.update((keyword.arg, keyword.value)
+                                 for keyword in decorator.keywords
+                                 if keyword.arg in parameters)
+                # Arguments passed with * or ** could be anything. Python 2
+                # keeps them in their own fields rather than with the rest.
+                unpacked = any(
+                    keyword.arg is None for keyword in decorator.keywords
+                ) or any(type(arg).__name__ == "Starred"
+                         for arg in decorator.args) or \
+                    getattr(decorator, "starargs", None) is not None or \
+                    getattr(decorator, "kwargs", None) is not None
+                entry = {"line": decorator.lineno, "qualname": qualname,
+                         "kind": "class" if isinstance(child, ast.ClassDef)
+                         else "function",
+                         "deprecated_in": None, "removed_in": None,
+                         "removed_on": None, "details": "",
+                         "current_version": None,
+                         "unresolved": ["*"] if unpacked else []}
+                for parameter, value_node in sorted(arguments.items()):
+                    value, resolved = _literal(value_node, names)
+                    if not resolved:
+                        entry["unresolved"].append(parameter)
+                    elif parameter == "removed_in" and \
+                            isinstance(value, date):
+                        entry["removed_on"] = value.isoformat()
+                    else:
+                        entry[parameter] = value
+                entries.append(entry)
+            inner = [child.name]
+            if not isinstance(child, ast.ClassDef):
+                inner.append("<locals>")
+            visit(child, scope + inner)
+
+    visit(tree, [])
+    return {"entries": entries, "references": sorted(references),
+            "aliases": aliases}
+
+
+def _scan_file(job):
+    """Index one file for _index(), unless its contents haven't changed
+
+    This runs in worker processes, so it takes and returns plain data:
+    ``(path, cached digest)`` in, ``(path, stat, digest, index, error)``
+    out, where ``index`` is None when the digest still matches.
+    """
+    import hashlib
+
+    path, cached_digest = job
+    try:
+        stat = os.stat(path)
+        with open(path, "rb") as f:
+            source = f.read()
+    except (IOError, OSError) as exc:
+        return path, None, None, None, str(exc)
+
+    stat = [getattr(stat, "st_mtime_ns", stat.st_mtime), stat.st_size]
+    digest = hashlib.sha1(source).hexdigest()
+    if digest == cached_digest:
+        return path, stat, digest, None, None
+    try:
+        return path, stat, digest, _scan_source(source, path), None
+    except (SyntaxError, ValueError) as exc:
+        return path, stat, digest, {"entries": [], "references": [],
+                                    "aliases": {}}, str(exc)
+
+
+def _load_scan_cache(cache_file):
+    import json
+
+    try:
+        with open(cache_file) as f:
+            cache = json.load(f)
+    except (IOError, OSError, ValueError):
+        return {}
+    if cache.get("version") != __version__ or \
+            cache.get("format") != _SCAN_CACHE_FORMAT:
+        return {}
+    return cache.get("files", {})
+
+
+def _save_scan_cache(cache_file, files):
+    import json
+
+    tmp = "%s.%d.tmp" % (cache_file, os.getpid())
+    with open(tmp, "w") as f:
+        json.dump({"version": __version__, "format": _SCAN_CACHE_FORMAT,
+                   "files": files}, f)
+    os.rename(tmp, cache_file)
+
+
+def _entry_state(entry, current_version):
+    """Compute the state of a scanned entry, or None if it can't be"""
+    unresolved = set(entry["unresolved"])
+    if current_version is not None:
+        unresolved.discard("current_version")
+    if unresolved - {"details"}:
+        return None
+    removed_in = entry["removed_in"]
+    if entry["removed_on"]:
+        removed_in = date(*[int(part)
+                            for part in entry["removed_on"].split("-")])
+    current_version = current_version or entry["current_version"]
+    if current_version is not None:
+        current_version = str(current_version)
+    try:
+        is_deprecated, is_unsupported = _deprecation_state(
+            entry["deprecated_in"] and str(entry["deprecated_in"]),
+            removed_in if isinstance(removed_in, date)
+            else removed_in and str(removed_in),
+            current_version)
+    except (TypeError, ValueError):
+        return None
+    if is_unsupported:
+        return "unsupported"
+    return "deprecated" if is_deprecated else "pending"
+
+
+def _run_jobs(function, jobs, processes):
+    """Map ``function`` over ``jobs``, in parallel when it's worth it"""
+    if processes == 1 or len(jobs) < 2:
+        return [function(job) for job in jobs]
+    import multiprocessing
+
+    pool = multiprocessing.Pool(processes)
+    try:
+        return pool.map(function, jobs, chunksize=max(1, min(
+            64, len(jobs) // ((processes or multiprocessing.cpu_count()) *
+                              4))))
+    finally:
+        pool.close()
+        pool.join()
+
+
+def _index(paths, cache_file, processes):
+    """Return the index of each Python file in ``paths`` by its path"""
+    cached = _load_scan_cache(cache_file) if cache_file else {}
+    files = {}
+    jobs = []
+    for path in _python_files(paths):
+        path = os.path.normpath(path)
+        entry = cached.get(path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            stat = None
+        if entry is not None and stat is not None and entry["stat"] == [
+                getattr(stat, "st_mtime_ns", stat.st_mtime), stat.st_size]:
+            files[path] = entry
+        else:
+            jobs.append((path, entry and entry["digest"]))
+
+    for path, stat, digest, index, error in _run_jobs(_scan_file, jobs,
+                                                      processes):
+        if error is not None:
+            sys.stderr.write("%s: %s\n" % (path, error))
+        if stat is None:
+            continue
+        if index is None:
+            index = cached[path]
+        files[path] = dict(index, stat=stat, digest=digest)
+
+    if cache_file and jobs:
+        _save_scan_cache(cache_file, files)
+
+    return files
+
+
+def scan(paths, current_version=None, cache_file=None, processes=None):
+    """Find uses of :func:`~deprecation.deprecated` without importing them
+
+    Python files are parsed with :mod:`ast`, in parallel across a pool of
+    processes, looking for functions and classes decorated with
+    ``@deprecated(...)`` or ``@deprecation.deprecated(...)``. Arguments to
+    the decorator are resolved when they're literals, calls to
+    ``date(...)``, or names assigned a literal at the top of the module,
+    such as ``__version__``.
+
+    Given a ``cache_file``, what's found in each file is cached there
+    along with the file's size, modification time and a hash of its
+    contents, so later calls only parse files that have changed. This is
+    also available on the command line as ``python -m deprecation scan``,
+    which caches in ``.deprecation-cache.json`` by default.
+
+    :param paths: Files or directories to scan.
+    :param current_version: The version to compute each entry's ``state``
+                            against. By default, the ``current_version``
+                            given to each decorator is used if it could be
+                            resolved.
+    :param cache_file: Where to keep the cache. By default there's none.
+    :param processes: The number of worker processes to use. The default
+                      of None uses one per CPU.
+    :returns: A list of dictionaries ordered by ``file`` and ``line``.
+              Besides those, each has the decorated object's ``qualname``,
+              its ``kind`` (``"function"`` or ``"class"``), the resolved
+              ``deprecated_in``, ``removed_in`` (a version), ``removed_on``
+              (an ISO 8601 date), ``details`` and ``current_version``, the
+              parameters it couldn't resolve in ``unresolved``, and
+              ``state``, which is ``"pending"``, ``"deprecated"``,
+              ``"unsupported"`` or None if it couldn't be computed.
+    """
+    files = _index(paths, cache_file, processes)
+    results = []
+    for path in sorted(files):
+        for entry in files[path]["entries"]:
+            result = dict(entry, file=path)
+            result["state"] = _entry_state(entry, current_version)
+            results.append(result)
+    return results
+
+
+def _module_name(path, packages):
+    """Return the dotted names of the module at ``path`` and its package
+
+    The package is found by walking up through directories that have an
+    ``__init__.py``. ``packages`` memoizes that walk for each directory.
+    """
+    directory, filename = os.path.split(os.path.abspath(path))
+    if directory not in packages:
+        parts = []
+        parent = directory
+        while os.path.isfile(os.path.join(parent, "__init__.py")):
+            parent, name = os.path.split(parent)
+            parts.insert(0, name)
+        packages[directory] = ".".join(parts)
+    package = packages[directory]
+    name = os.path.splitext(filename)[0]
+    if name == "__init__":
+        return package, package
+    return package + "." + name if package else name, package
+
+
+def _absolute_name(name, module, package):
+    """Resolve a name from _scan_source() as seen from ``module``"""
+    if name.startswith(":"):
+        return module + "." + name[1:]
+    if not name.startswith("."):
+        return name
+    relative = name.lstrip(".")
+    parts = package.split(".") if package else []
+    up = len(name) - len(relative) - 1
+    if up > len(parts):
+        return None
+    parts = parts[:len(parts) - up]
+    if relative:
+        parts.append(relative)
+    return ".".join(parts)
+
+
+def find_callers(paths, current_version=None, cache_file=None,
+                 processes=None):
+    """Find the code that refers to deprecated functions and classes
+
+    Deprecations are found the same way as :func:`~deprecation.scan`, and
+    are then looked up in an index of every name each file imports, along
+    with the attributes used on those names, such as ``module.function``
+    or ``Class.method``. Names imported from a package that imported them
+    from somewhere else are followed back to where they're defined.
+    The index can be cached for each file just as with
+    :func:`~deprecation.scan`, in the same cache file, so only files that
+    have changed are parsed again. This is also available on the command
+    line as ``python -m deprecation callers``.
+
+    As nothing is imported, calls that can only be resolved at runtime,
+    such as ``obj.method()`` where ``obj`` is an instance of a class with
+    a deprecated method, aren't found. :func:`~deprecation.sample_callers`
+    can find those.
+
+    :param paths: Files or directories to search. Module names are worked
+                  out from the ``__init__.py`` files around each file.
+    :param current_version: As for :func:`~deprecation.scan`.
+    :param cache_file: Where to keep the cache. By default there's none.
+    :param processes: The number of worker processes to use. The default
+                      of None uses one per CPU.
+    :returns: A list of dictionaries, one for each deprecated function or
+              class, ordered by when they're to be removed and then by
+              name. Each has the dotted ``symbol`` name, the ``file`` and
+              ``line`` where it's deprecated, its ``deprecated_in``,
+              ``removed_in``, ``removed_on`` and ``state`` as from
+              :func:`~deprecation.scan`, and ``callers``, a list of
+              dictionaries with the ``file``, ``line`` and ``scope`` of
+              each reference to it.
+    """
+    files = _index(paths, cache_file, processes)
+
+    packages = {}
+    modules = dict((path, _module_name(path, packages)) for path in files)
+    symbols = {}
+    aliases = {}
+    for path, index in files.items():
+        module, package = modules[path]
+        for entry in index["entries"]:
+            if "<locals>" in entry["qualname"]:
+                continue
+            symbol = module + "." + entry["qualname"]
+            symbols[symbol] = {
+                "symbol": symbol, "file": path, "line": entry["line"],
+                "deprecated_in": entry["deprecated_in"],
+                "removed_in": entry["removed_in"],
+                "removed_on": entry["removed_on"],
+                "state": _entry_state(entry, current_version),
+                "callers": []}
+        for name, target in index["aliases"].items():
+            target = _absolute_name(target, module, package)
+            if target is not None:
+                aliases[module + "." + name] = target
+
+    def lookup(name):
+        # Follow re-exports a few times over, but not around in circles.
+        for _ in range(8):
+            parts = name.split(".")
+            for end in range(len(parts), 0, -1):
+                prefix = ".".join(parts[:end])
+                if prefix in symbols:
+                    return symbols[prefix]
+                if prefix in aliases and aliases[prefix] != prefix:
+                    name = aliases[prefix] + name[len(prefix):]
+                    break
+            else:
+                return None
+        return None
+
+    if symbols:
+        for path in sorted(files):
+            module, package = modules[path]
+            for name, line, scope in files[path]["references"]:
+                name = _absolute_name(name, module, package)
+                symbol = name and lookup(name)
+                if symbol is not None:
+                    symbol["callers"].append({"file": path, "line": line,
+                                              "scope": scope})
+
+    def removal(symbol):
+        if symbol["removed_on"]:
+            return 0, symbol["removed_on"]
+        if symbol["removed_in"] is not None:
+            try:
+                return 1, _parse_version(str(symbol["removed_in"]))
+            except ValueError:
+                return 2, str(symbol["removed_in"])
+        return 3, None
+
+    return sorted(symbols.values(),
+                  key=lambda symbol: (removal(symbol), symbol["symbol"]))
+
+
+def _parse_date(value):
+    """Return ``value`` as a date if it's one or an ISO 8601 date string"""
+    if isinstance(value, date) or value is None:
+        return value
+    return date(*[int(part) for part in value.split("-")])
+
+
+class ReleasePlan(object):
+    """Find which deprecations change state between two releases
+
+    Each deprecation's versions are parsed once and kept in sorted
+    columns, one for each of ``deprecated_in``, version ``removed_in``
+    and ``removed_on`` dates, so finding what changes between two
+    versions or dates is a binary search of each column rather than
+    working out every deprecation's state again. ::
+
+        plan = deprecation.ReleasePlan(deprecation.scan(["src"]))
+        for change in plan.changes("1.5", "2.0"):
+            print(change["qualname"], change["before"], change["after"])
+
+    :param deprecations: Dictionaries with the ``deprecated_in`` and
+                         ``removed_in`` of each deprecation, and optionally
+                         a ``removed_on`` ISO 8601 date, such as those
+                         returned by :func:`~deprecation.scan` or
+                         :func:`~deprecation.usage`. ``removed_in`` may
+                         also be a :class:`datetime.date`. Other keys are
+                         passed through to :meth:`changes`. Deprecations
+                         whose versions can't be parsed, or that
+                         :func:`~deprecation.scan` couldn't resolve, are
+                         left out.
+    """
+
+    def __init__(self, deprecations):
+        import bisect
+
+        self._bisect = bisect.bisect_right
+        self.deprecations = list(deprecations)
+        # index -> (deprecated_in, removed_in) parsed, or the removal date.
+        self._versions = {}
+        self._dates = {}
+        deprecated_in, removed_in, removed_on = [], [], []
+        for index, entry in enumerate(self.deprecations):
+            if set(entry.get("unresolved", ())) - set(["details",
+                                                       "current_version"]):
+                continue
+            removed = entry.get("removed_on") or entry.get("removed_in")
+            try:
+                if isinstance(removed, date) or entry.get("removed_on"):
+                    removed_on.append((_parse_date(removed), index))
+                    self._dates[index] = removed_on[-1][0]
+                    continue
+                versions = tuple(
+                    None if value in (None, "") else _parse_version(str(value))
+                    for value in (entry.get("deprecated_in"), removed))
+            except (TypeError, ValueError):
+                continue
+            self._versions[index] = versions
+            if versions[0] is not None:
+                deprecated_in.append((versions[0], index))
+            if versions[1] is not None:
+                removed_in.append((versions[1], index))
+
+        self._columns = []
+        for column in (deprecated_in, removed_in, removed_on):
+            column.sort(key=lambda item: item[0])
+            self._columns.append(([key for key, _ in column],
+                                  [index for _, index in column]))
+
+    def _between(self, column, old, new):
+        keys, indexes = self._columns[column]
+        low, high = sorted([old, new])
+        return indexes[self._bisect(keys, low):self._bisect(keys, high)]
+
+    def _version_state(self, index, current):
+        deprecated_in, removed_in = self._versions[index]
+        if removed_in is not None and current >= removed_in:
+            return "unsupported"
+        if deprecated_in is not None and current >= deprecated_in:
+            return "deprecated"
+        return "pending"
+
+    def _date_state(self, index, today):
+        return "unsupported" if today >= self._dates[index] else "deprecated"
+
+    def changes(self, old_version=None, new_version=None, old_date=None,
+                new_date=None):
+        """Return the deprecations whose state differs between two releases
+
+        Deprecations removed in a version change state with the version,
+        and those removed on a date change state with the date, the same
+        as with :func:`~deprecation.deprecated`.
+
+        :param old_version: The version to compare from.
+        :param new_version: The version to compare to. Version changes are
+                            only looked for when both are given.
+        :param old_date: The date to compare from, as a
+                         :class:`datetime.date` or ISO 8601 string. The
+                         default is today.
+        :param new_date: The date to compare to. The default is
+                         ``old_date``, so nothing changes by date.
+        :returns: A list of copies of the changed deprecations, in the
+                  order they were given, each with the ``before`` and
+                  ``after`` states, which are ``"pending"``,
+                  ``"deprecated"`` or ``"unsupported"``.
+        """
+        changes = {}
+        if old_version is not None and new_version is not None:
+            old_version = _parse_version(str(old_version))
+            new_version = _parse_version(str(new_version))
+            for column in (0, 1):
+                for index in self._between(column, old_version, new_version):
+                    changes[index] = (
+                        self._version_state(index, old_version),
+                        self._version_state(index, new_version))
+
+        old_date = _parse_date(old_date) or date.today()
+        new_date = _parse_date(new_date) or old_date
+        for index in self._between(2, old_date, new_date):
+            changes[index] = (self._date_state(index, old_date),
+                              self._date_state(index, new_date))
+
+        return [dict(self.deprecations[index], before=before, after=after)
+                for index, (before, after) in sorted(changes.items())
+                if before != after]
+
+
+def _write_report(rows, fields, output_format, output):
+    if output_format == "csv":
+        import csv
+
+        writer = csv.DictWriter(output, fields, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(rows)
+    else:
+        import json
+
+        json.dump(rows, output, indent=2, sort_keys=True, default=str)
+        output.write("\n")
+
+
+def main(argv=None):
+    """Run the ``python -m deprecation`` command line interface"""
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="python -m deprecation")
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("paths", nargs="+", metavar="path")
+    common.add_argument("--format", choices=["json", "csv"], default="json")
+    common.add_argument("-o", "--output",
+                        help="write the report here instead of stdout")
+    common.add_argument("--cache", default=_SCAN_CACHE_FILE,
+                        help="cache file (default: %(default)s)")
+    common.add_argument("--no-cache", dest="cache", action="store_const",
+                        const=None)
+    common.add_argument("-j", "--jobs", type=int,
+                        help="worker processes (default: one per CPU)")
+
+    current = argparse.ArgumentParser(add_help=False)
+    current.add_argument("--current-version",
+                         help="compute states against this version")
+
+    commands.add_parser(
+        "scan", parents=[common, current],
+        help="list deprecations in source files without importing them")
+    commands.add_parser(
+        "callers", parents=[common, current],
+        help="list the code that refers to each deprecation")
+    plan_parser = commands.add_parser(
+        "plan", parents=[common],
+        help="list the deprecations that change state between releases")
+    plan_parser.add_argument("--from", dest="from_version",
+                             help="the version to compare from")
+    plan_parser.add_argument("--to", dest="to_version",
+                             help="the version to compare to")
+    plan_parser.add_argument("--from-date",
+                             help="the date to compare from, as YYYY-MM-DD "
+                                  "(default: today)")
+    plan_parser.add_argument("--to-date",
+                             help="the date to compare to, as YYYY-MM-DD")
+
+    args = parser.parse_args(argv)
+    if args.command == "plan" and (args.from_version is None) != \
+            (args.to_version is None):
+        parser.error("--from and --to must be given together")
+
+    if args.command == "scan":
+        rows = scan(args.paths, args.current_version, args.cache, args.jobs)
+        fields = _SCAN_FIELDS
+    elif args.command == "callers":
+        rows = find_callers(args.paths, args.current_version, args.cache,
+                            args.jobs)
+        fields = _CALLER_FIELDS
+        if args.format == "csv":
+            # One row for each caller, or one for symbols without any.
+            rows = [dict(symbol, **caller)
+                    for symbol in rows
+                    for caller in symbol["callers"] or
+                    [{"file": None, "line": None, "scope": None}]]
+    elif args.command == "plan":
+        plan = ReleasePlan(scan(args.paths, None, args.cache, args.jobs))
+        rows = plan.changes(args.from_version, args.to_version,
+                            args.from_date, args.to_date)
+        fields = _PLAN_FIELDS
+
+    if args.output:
+        with open(args.output, "w") as output:
+            _write_report(rows, fields, args.format, output)
+    else:
+        _write_report(rows, fields, args.format, sys.stdout)
+    return 0
+
+
+if __name__ == "__main__":
+    # Run from the importable module rather than __main__ so that
+    # worker processes can find the functions they're given.
+    import deprecation
+    sys.exit(deprecation.main())
@@ -12,6 +12,11 @@
 
 # As we unfortunately support Python 2.7, it lacks TestCase.subTest which
 # is in 3.4+ or in unittest2
+import os
+import shutil
+import sys
+import tempfile
+import textwrap
 import unittest2
 import warnings
 
@@ -19,6 +24,27 @@ import deprecation
 from datetime import date
 
 
+def _call(fn, *args, **kwargs):
+    """Call ``fn``, returning its result and the warnings it emitted"""
+    with warnings.catch_warnings(record=True) as caught_warnings:
+        warnings.simplefilter("always")
+        rv = fn(*args, **kwargs)
+    return rv, caught_warnings
+
+
+def _messages(fn, *args, **kwargs):
+    """Call ``fn``, returning its result and its warnings' messages"""
+    rv, caught_warnings = _call(fn, *args, **kwargs)
+    return rv, [str(w.message) for w in caught_warnings]
+
+
+def _temporary_directory(test):
+    """Return a new directory that's removed when ``test`` finishes"""
+    directory = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, directory)
+    return directory
+
+
 class Test_deprecated(unittest2.TestCase):
 
     def test_args_set_on_base_class(self):
@@ -26,6 +52,21 @@ class Test_deprecated(unittest2.TestCase):
         dw = deprecation.DeprecatedWarning(*args)
         self.assertEqual(dw.args, args)
 
+    def test_message_shared_between_warnings(self):
+        @deprecation.deprecated(deprecated_in="1.0", current_version="2.0")
+        def fn():
+            pass
+
+        with warnings.catch_warnings(record=True) as caught_warnings:
+            warnings.simplefilter("always")
+            fn()
+            fn()
+
+        first, second = [w.message for w in caught_warnings]
+        self.assertIsNot(first, second)
+        self.assertEqual(str(first), "fn is deprecated as of 1.0.")
+        self.assertIs(str(first), str(second))
+
     def test_removing_without_deprecating(self):
         self.assertRaises(TypeError, deprecation.deprecated,
                           deprecated_in=None, removed_in="1.0")
@@ -58,6 +99,18 @@ class Test_deprecated(unittest2.TestCase):
 
                 self.assertEqual(fn.__doc__, test["__doc__"])
 
+    def test_docstring_not_rewritten_without_docstrings(self):
+        # This is the case when running under -OO.
+        self.addCleanup(setattr, deprecation, "_rewrite_docstrings",
+                        deprecation._rewrite_docstrings)
+        deprecation._rewrite_docstrings = False
+
+        @deprecation.deprecated(deprecated_in="1.0")
+        def fn():
+            pass
+
+        self.assertIsNone(fn.__doc__)
+
     def test_multiline_docstring(self):
         docstring = "summary line\n\ndetails\nand more details\n"
         for test in [{"args": {},
@@ -211,6 +264,31 @@ class Test_deprecated(unittest2.TestCase):
                 self.assertEqual(str(caught_warnings[0].message),
                                  test["message"])
 
+    def test_removal_date_passes(self):
+        import time
+        from datetime import timedelta
+
+        tomorrow = date.today() + timedelta(days=1)
+
+        @deprecation.deprecated(deprecated_in="1.0", removed_in=tomorrow)
+        def fn():
+            pass
+
+        self.addCleanup(setattr, deprecation, "_time", deprecation._time)
+
+        for days, warning in [(0, deprecation.DeprecatedWarning),
+                              (1, deprecation.UnsupportedWarning)]:
+            with self.subTest(days=days):
+                now = time.mktime((date.today() +
+                                   timedelta(days=days)).timetuple())
+                deprecation._time = lambda: now
+
+                _, caught_warnings = _call(fn)
+                self.assertEqual(caught_warnings[0].category, warning)
+
+        self.assertEqual(str(caught_warnings[0].message),
+                         "fn is unsupported as of %s." % tomorrow)
+
     def test_DeprecatedWarning_not_raised(self):
         ret_val = "lololol"
 
@@ -229,6 +307,990 @@ class Test_deprecated(unittest2.TestCase):
             sot = Test()
             self.assertEqual(sot.method(), ret_val)
 
+    def test_emit_warnings_disabled(self):
+        @deprecation.deprecated()
+        def fn():
+            return 1
+
+        self.addCleanup(setattr, deprecation, "emit_warnings",
+                        deprecation.emit_warnings)
+
+        with warnings.catch_warnings(record=True) as caught_warnings:
+            warnings.simplefilter("always")
+
+            deprecation.emit_warnings = False
+            self.assertEqual(fn(), 1)
+            self.assertEqual(len(caught_warnings), 0)
+
+            # Toggling it back applies to already decorated functions.
+            deprecation.emit_warnings = True
+            self.assertEqual(fn(), 1)
+            self.assertEqual(len(caught_warnings), 1)
+
+    def test_versions_parsed_once(self):
+        deprecation._parse_version.cache_clear()
+        first = deprecation._parse_version("1.0")
+        self.assertIs(deprecation._parse_version("1.0"), first)
+
+        deprecation._parse_version.cache_clear()
+        self.assertIsNot(deprecation._parse_version("1.0"), first)
+
+    def test_version_state(self):
+        for args, state in [(("1.0", "2.0", "0.5"), (False, False)),
+                            (("1.0", "2.0", "1.0"), (True, False)),
+                            (("1.0", "2.0", "2.0"), (False, True)),
+                            (("1.0", None, "3.0"), (True, False))]:
+            with self.subTest(args=args):
+                self.assertEqual(deprecation._version_state(*args), state)
+
+    def test_release_versions_compare_like_packaging(self):
+        from packaging import version
+
+        versions = ["0.5", "1", "1.0", "1.0.0", "1.0.1", "1.1", "1.10",
+                    "2.0", "2.0.0.0", "10.0", "01.2"]
+        for a in versions:
+            for b in versions:
+                with self.subTest(a=a, b=b):
+                    self.assertEqual(
+                        deprecation._parse_release(a) >=
+                        deprecation._parse_release(b),
+                        version.parse(a) >= version.parse(b))
+
+    def test_other_versions_use_packaging(self):
+        for value in ["1.0rc1", "1.0.post1", "v1.0", "1.0+local", "1..0",
+                      "", "1.0.dev0", "1!2.0"]:
+            with self.subTest(value=value):
+                self.assertIsNone(deprecation._parse_release(value))
+        self.assertEqual(deprecation._version_state("1.0rc1", None, "1.0"),
+                         (True, False))
+        self.assertEqual(deprecation._version_state("1.0", "2.0", "2.0rc1"),
+                         (True, False))
+
+    def test_import_is_lazy(self):
+        import subprocess
+
+        # packaging and textwrap are only imported once they're needed.
+        code = ("import sys, deprecation; "
+                "print(sorted(set(['packaging', 'textwrap']) & "
+                "set(sys.modules)))")
+        env = dict(os.environ, PYTHONPATH=os.path.dirname(
+            os.path.dirname(os.path.abspath(__file__))))
+        output = subprocess.check_output([sys.executable, "-c", code],
+                                         env=env)
+        self.assertEqual(output.decode().strip(), "[]")
+
+
+# These are compiled at runtime so the tests can still be
+# loaded by Pythons that can't parse them.
+ASYNC_FUNCTIONS = """
+async def coroutine(value):
+    return value
+
+
+async def async_generator(count):
+    for i in range(count):
+        received = yield i
+        if received is not None:
+            yield received
+
+
+async def consume(agen):
+    values = [await agen.__anext__()]
+    values.append(await agen.asend("sent"))
+    async for value in agen:
+        values.append(value)
+    return values
+"""
+
+
+class Test_deprecated_generators(unittest2.TestCase):
+
+    def test_generator(self):
+        @deprecation.deprecated(deprecated_in="1.0")
+        def gen(count):
+            for i in range(count):
+                received = yield i
+                if received is not None:
+                    yield received
+
+        def consume():
+            it = gen(3)
+            values = [next(it), it.send("sent")]
+            values.extend(it)
+            return values
+
+        values, caught_warnings = _call(consume)
+        self.assertEqual(values, [0, "sent", 1, 2])
+        self.assertEqual(len(caught_warnings), 1)
+        self.assertEqual(str(caught_warnings[0].message),
+                         "gen is deprecated as of 1.0.")
+
+    def test_generator_warns_when_called(self):
+        @deprecation.deprecated(deprecated_in="1.0")
+        def gen():
+            yield 1
+
+        with warnings.catch_warnings(record=True) as caught_warnings:
+            warnings.simplefilter("always")
+            # The generator is never iterated.
+            gen()
+            line = sys._getframe().f_lineno - 1
+        self.assertEqual(len(caught_warnings), 1)
+        self.assertEqual(caught_warnings[0].filename, __file__)
+        self.assertEqual(caught_warnings[0].lineno, line)
+
+    @unittest2.skipIf(sys.version_info < (3, 7), "requires asyncio.run")
+    def test_coroutine(self):
+        import asyncio
+
+        namespace = {}
+        exec(ASYNC_FUNCTIONS, namespace)
+        coroutine = deprecation.deprecated()(namespace["coroutine"])
+
+        value, caught_warnings = _call(lambda: asyncio.run(coroutine(1)))
+        self.assertEqual(value, 1)
+        self.assertEqual(len(caught_warnings), 1)
+        if sys.version_info >= (3, 12):
+            # Earlier versions warn when the event loop first awaits it.
+            self.assertEqual(caught_warnings[0].filename, __file__)
+
+    @unittest2.skipIf(sys.version_info < (3, 6), "requires async def")
+    def test_coroutine_function_introspection(self):
+        import asyncio
+        import inspect
+
+        namespace = {}
+        exec(ASYNC_FUNCTIONS, namespace)
+        for exact_signature in [False, True]:
+            coroutine = deprecation.deprecated(
+                exact_signature=exact_signature)(namespace["coroutine"])
+            with self.subTest(exact_signature=exact_signature):
+                self.assertTrue(inspect.iscoroutinefunction(coroutine))
+                self.assertTrue(asyncio.iscoroutinefunction(coroutine))
+
+    @unittest2.skipIf(sys.version_info < (3, 7), "requires asyncio.run")
+    def test_async_generator(self):
+        import asyncio
+
+        namespace = {}
+        exec(ASYNC_FUNCTIONS, namespace)
+        agen = deprecation.deprecated()(namespace["async_generator"])
+
+        values, caught_warnings = _call(
+            lambda: asyncio.run(namespace["consume"](agen(3))))
+        self.assertEqual(values, [0, "sent", 1, 2])
+        self.assertEqual(len(caught_warnings), 1)
+        self.assertEqual(caught_warnings[0].filename, __file__)
+
+
+# Keyword-only and positional-only parameters, compiled at runtime for
+# the same reason.
+SIGNATURE_FUNCTIONS = """
+def keyword_only(a, *, b, c=3):
+    return a, b, c
+
+
+def positional_only(a, b=2, /, c=3):
+    return a, b, c
+"""
+
+
+class Test_deprecated_exact_signature(unittest2.TestCase):
+
+    def test_signature(self):
+        import inspect
+
+        def fn(a, b, c=3, *args, **kwargs):
+            return a, b, c, args, kwargs
+
+        wrapped = deprecation.deprecated("1.0", exact_signature=True)(fn)
+
+        self.assertIsNot(wrapped, fn)
+        self.assertEqual(wrapped.__name__, "fn")
+        self.assertEqual(wrapped.__defaults__, (3,))
+        argspec = getattr(inspect, "getfullargspec", None) or \
+            inspect.getargspec
+        self.assertEqual(tuple(argspec(wrapped)), tuple(argspec(fn)))
+        for args, kwargs, expected in [
+                ((1, 2), {}, (1, 2, 3, (), {})),
+                ((1, 2, 4, 5), {"d": 6}, (1, 2, 4, (5,), {"d": 6})),
+                ((), {"a": 1, "b": 2, "c": 4}, (1, 2, 4, (), {}))]:
+            with self.subTest(args=args, kwargs=kwargs):
+                rv, caught_warnings = _call(wrapped, *args, **kwargs)
+                self.assertEqual(rv, expected)
+                self.assertEqual(len(caught_warnings), 1)
+                self.assertEqual(caught_warnings[0].filename, __file__)
+
+        self.assertRaises(TypeError, wrapped, 1)
+
+    @unittest2.skipIf(sys.version_info < (3, 8),
+                      "requires positional-only parameters")
+    def test_keyword_and_positional_only(self):
+        namespace = {}
+        exec(SIGNATURE_FUNCTIONS, namespace)
+        keyword_only = deprecation.deprecated(exact_signature=True)(
+            namespace["keyword_only"])
+        positional_only = deprecation.deprecated(exact_signature=True)(
+            namespace["positional_only"])
+
+        self.assertEqual(keyword_only.__kwdefaults__, {"c": 3})
+        self.assertEqual(_call(keyword_only, 1, b=2)[0], (1, 2, 3))
+        self.assertRaises(TypeError, keyword_only, 1, 2)
+        self.assertEqual(_call(positional_only, 1, c=4)[0], (1, 2, 4))
+        self.assertRaises(TypeError, positional_only, a=1)
+
+    def test_methods(self):
+        class Test(object):
+            @deprecation.deprecated(exact_signature=True)
+            def method(self, value):
+                return value
+
+            @classmethod
+            @deprecation.deprecated(exact_signature=True)
+            def cm(cls, value):
+                return cls, value
+
+        rv, caught_warnings = _call(Test().method, 1)
+        self.assertEqual(rv, 1)
+        self.assertEqual(len(caught_warnings), 1)
+        self.assertEqual(_call(Test.cm, 2)[0], (Test, 2))
+
+    def test_wrappers_shared_between_signatures(self):
+        def first(a, b=1):
+            pass
+
+        def second(a, b=2):
+            pass
+
+        for fn in (first, second):
+            deprecation.deprecated(exact_signature=True)(fn)
+        shape = deprecation._signature_shape(first.__code__, (1,), None)
+        self.assertIn(shape, deprecation._signature_wrappers)
+        self.assertEqual(shape, deprecation._signature_shape(
+            second.__code__, (2,), None))
+
+    def test_reserved_names_fall_back(self):
+        def fn(emit_warnings, _deprecation_function=None):
+            return emit_warnings
+
+        wrapped = deprecation.deprecated(exact_signature=True)(fn)
+
+        self.assertEqual(_call(wrapped, 1)[0], 1)
+        # The usual wrapper, taking *args and **kwargs.
+        self.assertTrue(wrapped.__code__.co_flags &
+                        deprecation._CO_VARARGS)
+
+
+class Test_deprecated_descriptors(unittest2.TestCase):
+
+    def test_class(self):
+        @deprecation.deprecated(deprecated_in="1.0")
+        class Old(object):
+            """docstring"""
+
+            def __init__(self, value):
+                self.value = value
+
+        if sys.version_info >= (3, 3):
+            # Older versions don't allow setting a class's __doc__.
+            self.assertEqual(Old.__doc__,
+                             "docstring\n\n.. deprecated:: 1.0")
+        instances = []
+        self.assertEqual(_messages(lambda: instances.append(Old(1)))[1],
+                         ["Old is deprecated as of 1.0."])
+        self.assertIsInstance(instances[0], Old)
+        self.assertEqual(instances[0].value, 1)
+
+    def test_class_without_init(self):
+        @deprecation.deprecated()
+        class Old(object):
+            def __new__(cls, value):
+                return super(Old, cls).__new__(cls)
+
+        self.assertEqual(_messages(lambda: Old(1))[1],
+                         ["Old is deprecated"])
+
+    @unittest2.skipIf(sys.version_info < (3, 6), "requires __init_subclass__")
+    def test_subclass(self):
+        @deprecation.deprecated()
+        class Old(object):
+            def __init_subclass__(cls, flag=False, **kwargs):
+                super().__init_subclass__(**kwargs)
+                cls.flag = flag
+
+        def subclass():
+            import types
+            new = types.new_class("New", (Old,), {"flag": True})
+            self.assertTrue(new.flag)
+
+        self.assertEqual(_messages(subclass)[1], ["Old is deprecated"])
+
+    def test_property(self):
+        class Test(object):
+            _value = 1
+
+            @deprecation.deprecated(details="Use value instead.")
+            @property
+            def old_value(self):
+                """docstring"""
+                return self._value
+
+            @old_value.setter
+            def old_value(self, value):
+                self._value = value
+
+        self.assertIsInstance(Test.old_value, property)
+        self.assertEqual(Test.old_value.__doc__,
+                         "docstring\n\n.. deprecated:: Use value instead.")
+
+        obj = Test()
+        message = "old_value is deprecated. Use value instead."
+        self.assertEqual(_messages(lambda: obj.old_value)[1], [message])
+        self.assertEqual(
+            _messages(lambda: setattr(obj, "old_value", 2))[1], [message])
+        self.assertEqual(obj._value, 2)
+
+    @unittest2.skipIf(sys.version_info < (3, 6), "requires __set_name__")
+    def test_property_without_getter(self):
+        def _set(obj, value):
+            obj._value = value
+
+        class Test(object):
+            write_only = deprecation.deprecated()(property(None, _set))
+
+        obj = Test()
+        self.assertEqual(
+            _messages(lambda: setattr(obj, "write_only", 2))[1],
+            ["write_only is deprecated"])
+        self.assertEqual(obj._value, 2)
+
+    def test_empty_property(self):
+        self.assertRaises(TypeError, deprecation.deprecated(), property())
+
+    def test_classmethod_and_staticmethod(self):
+        class Test(object):
+            @deprecation.deprecated()
+            @classmethod
+            def cm(cls):
+                return cls
+
+            @deprecation.deprecated()
+            @staticmethod
+            def sm(value):
+                return value
+
+        self.assertIsInstance(Test.__dict__["cm"], classmethod)
+        self.assertIsInstance(Test.__dict__["sm"], staticmethod)
+        self.assertEqual(_messages(Test.cm)[1], ["cm is deprecated"])
+        self.assertEqual(_messages(lambda: Test().sm(1))[1],
+                         ["sm is deprecated"])
+        self.assertIs(Test.cm(), Test)
+        self.assertEqual(Test.sm(1), 1)
+
+
+class Test_deprecated_parameters(unittest2.TestCase):
+
+    def test_deprecated_params(self):
+        @deprecation.deprecated_params(["b", "c"], deprecated_in="1.0")
+        def fn(a, b=None, **kwargs):
+            return a, b, kwargs
+
+        self.assertEqual(_messages(fn, 1), ((1, None, {}), []))
+        self.assertEqual(_messages(fn, a=1, d=4), ((1, None, {"d": 4}), []))
+        self.assertEqual(_messages(fn, 1, 2),
+                         ((1, 2, {}), ["fn(b=...) is deprecated as of 1.0."]))
+        self.assertEqual(_messages(fn, 1, b=2),
+                         ((1, 2, {}), ["fn(b=...) is deprecated as of 1.0."]))
+        self.assertEqual(_messages(fn, 1, c=3),
+                         ((1, None, {"c": 3}),
+                          ["fn(c=...) is deprecated as of 1.0."]))
+
+    def test_deprecated_params_single_name(self):
+        @deprecation.deprecated_params("a")
+        def fn(a=None):
+            return a
+
+        self.assertEqual(_messages(fn), (None, []))
+        self.assertEqual(_messages(fn, 1), (1, ["fn(a=...) is deprecated"]))
+
+    def test_renamed_kwarg(self):
+        @deprecation.renamed_kwarg("timout", "timeout", deprecated_in="1.0",
+                                   removed_in="2.0", current_version="1.0")
+        def fn(timeout=None):
+            return timeout
+
+        self.assertEqual(_messages(fn, 1), (1, []))
+        self.assertEqual(_messages(fn, timeout=1), (1, []))
+        self.assertEqual(_messages(fn, timout=1),
+                         (1, ["fn(timout=...) is deprecated as of 1.0 and "
+                              "will be removed in 2.0. Use timeout "
+                              "instead."]))
+        self.assertRaises(TypeError, _messages, fn, timout=1, timeout=2)
+
+    def test_stacked_decorators_warn_at_call_site(self):
+        @deprecation.deprecated(deprecated_in="1.0")
+        @deprecation.renamed_kwarg("timout", "timeout", deprecated_in="1.0")
+        def fn(timeout=None):
+            return timeout
+
+        with warnings.catch_warnings(record=True) as caught_warnings:
+            warnings.simplefilter("always")
+            fn(timout=1)
+        self.assertEqual(len(caught_warnings), 2)
+        for caught in caught_warnings:
+            self.assertEqual(caught.filename, __file__)
+
+    def test_removing_without_deprecating(self):
+        self.assertRaises(TypeError, deprecation.deprecated_params, "a",
+                          removed_in="1.0")
+        self.assertRaises(TypeError, deprecation.renamed_kwarg, "a", "b",
+                          removed_in="1.0")
+
+
+@unittest2.skipIf(sys.version_info < (3, 7), "requires module __getattr__")
+class Test_deprecate_attributes(unittest2.TestCase):
+
+    def setUp(self):
+        import types
+
+        self.module = types.ModuleType("deprecated_module")
+        self.module.old = 1
+        self.module.new = 2
+        sys.modules[self.module.__name__] = self.module
+        self.addCleanup(sys.modules.pop, self.module.__name__)
+
+    def test_existing_names(self):
+        deprecation.deprecate_attributes(self.module.__name__, ["old"],
+                                         deprecated_in="1.0",
+                                         details="Use new instead.")
+
+        self.assertNotIn("old", vars(self.module))
+        self.assertIn("old", dir(self.module))
+        for _ in range(2):
+            self.assertEqual(_messages(getattr, self.module, "old"),
+                             (1, ["old is deprecated as of 1.0. "
+                                  "Use new instead."]))
+        self.assertEqual(_messages(getattr, self.module, "new"), (2, []))
+
+    def test_existing_string(self):
+        self.module.OLD_URL = "http://example.com"
+        deprecation.deprecate_attributes(self.module.__name__, ["OLD_URL"],
+                                         deprecated_in="1.0")
+
+        for _ in range(2):
+            self.assertEqual(_messages(getattr, self.module, "OLD_URL"),
+                             ("http://example.com",
+                              ["OLD_URL is deprecated as of 1.0."]))
+
+    def test_lazy_import(self):
+        import types
+
+        deprecation.deprecate_attributes(
+            self.module, {"lazy": "lazy_target:value",
+                          "lazy_module": "lazy_target"})
+
+        # The target doesn't need to be importable until it's accessed.
+        target = types.ModuleType("lazy_target")
+        target.value = "lazy value"
+        sys.modules["lazy_target"] = target
+        self.addCleanup(sys.modules.pop, "lazy_target")
+
+        self.assertEqual(_messages(getattr, self.module, "lazy"),
+                         ("lazy value", ["lazy is deprecated"]))
+        self.assertEqual(_messages(getattr, self.module, "lazy_module"),
+                         (target, ["lazy_module is deprecated"]))
+
+    def test_missing_names(self):
+        deprecation.deprecate_attributes(self.module, {"old2": 3})
+        self.assertRaises(AttributeError, getattr, self.module, "missing")
+
+        # Deprecating more names keeps the earlier ones working.
+        deprecation.deprecate_attributes(self.module, ["old"])
+        self.assertEqual(_messages(getattr, self.module, "old2"), (3, ["old2 is deprecated"]))
+        self.assertEqual(_messages(getattr, self.module, "old"), (1, ["old is deprecated"]))
+
+
+LEGACY_MODULE = """
+from os.path import join
+
+def function(a):
+    return a
+
+def _private():
+    pass
+
+class Class(object):
+    def __init__(self, value=None):
+        self.value = value
+
+class Subclass(Class):
+    pass
+
+CONSTANT = 1
+"""
+
+LEGACY_CLASS = """
+class Class(object):
+    def method(self):
+        return "method"
+
+    @classmethod
+    def class_method(cls):
+        return cls
+
+    @staticmethod
+    def static_method(value):
+        return value
+
+    @property
+    def attribute(self):
+        return "attribute"
+
+    def _private(self):
+        return "private"
+
+class Subclass(Class):
+    def other(self):
+        return "other"
+"""
+
+
+class Test_deprecate_module(unittest2.TestCase):
+
+    def setUp(self):
+        import types
+
+        self.module = types.ModuleType("legacy_module")
+        exec(LEGACY_MODULE, vars(self.module))
+        sys.modules[self.module.__name__] = self.module
+        self.addCleanup(sys.modules.pop, self.module.__name__)
+
+    def test_public_names(self):
+        join = self.module.join
+        deprecation.deprecate_module(self.module.__name__,
+                                     deprecated_in="1.0",
+                                     details="Use new instead.")
+
+        self.assertEqual(_messages(self.module.function, 1),
+                         (1, ["function is deprecated as of 1.0. "
+                              "Use new instead."]))
+        _, messages = _messages(self.module.Class)
+        self.assertEqual(messages, ["Class is deprecated as of 1.0. "
+                                    "Use new instead."])
+        self.assertEqual(_messages(self.module._private), (None, []))
+        self.assertIs(self.module.join, join)
+        self.assertEqual(self.module.CONSTANT, 1)
+
+    def test_subclass_warns_once(self):
+        deprecation.deprecate_module(self.module, deprecated_in="1.0")
+
+        instance, messages = _messages(self.module.Subclass, 1)
+        self.assertEqual(instance.value, 1)
+        self.assertEqual(messages, ["Subclass is deprecated as of 1.0."])
+
+    def test_all(self):
+        self.module.__all__ = ["function"]
+        deprecation.deprecate_module(self.module, deprecated_in="1.0")
+
+        self.assertEqual(_messages(self.module.function, 1),
+                         (1, ["function is deprecated as of 1.0."]))
+        self.assertEqual(_messages(self.module.Class)[1], [])
+
+    def test_submodules(self):
+        self.module.function.__module__ = "legacy_module._implementation"
+        deprecation.deprecate_module(self.module, deprecated_in="1.0")
+
+        self.assertEqual(_messages(self.module.function, 1)[1],
+                         ["function is deprecated as of 1.0."])
+
+    def test_already_deprecated(self):
+        namespace = vars(self.module)
+        namespace["function"] = deprecation.deprecated(
+            "1.0", details="already")(namespace["function"])
+        namespace["Class"] = deprecation.deprecated(
+            "1.0", details="already")(namespace["Class"])
+        deprecation.deprecate_module(self.module, deprecated_in="2.0")
+
+        for fn in [lambda: self.module.function(1), self.module.Class]:
+            messages = _messages(fn)[1]
+            self.assertEqual(len(messages), 1)
+            self.assertIn("already", messages[0])
+
+    def test_settings_are_shared(self):
+        self.module.__all__ = ["shared_one", "shared_two"]
+        exec("def shared_one():\n    pass\n"
+             "def shared_two():\n    pass\n", vars(self.module))
+        deprecation.deprecate_module(self.module, deprecated_in="1.0",
+                                     ignore_callers=["legacy_module"])
+
+        records = [record for record in list(deprecation._registry)
+                   if record.name in self.module.__all__]
+        self.assertEqual(len(records), 2)
+        self.assertIs(records[0].ignore_callers, records[1].ignore_callers)
+
+    @unittest2.skipIf(sys.version_info < (3, 4), "requires tracemalloc")
+    def test_memory_per_function(self):
+        import tracemalloc
+
+        source = "".join("def function%d(a, b=None):\n    return a\n" % i
+                         for i in range(200))
+        exec(source, vars(self.module))
+        self.addCleanup(tracemalloc.stop)
+        tracemalloc.start()
+        # How often the set of live records has to grow its table
+        # depends on what earlier tests left behind, so that isn't counted.
+        registry = deprecation._registry.data
+        before = tracemalloc.get_traced_memory()[0] - sys.getsizeof(registry)
+        deprecation.deprecate_module(self.module, deprecated_in="1.0")
+        used = (tracemalloc.get_traced_memory()[0] - sys.getsizeof(registry) -
+                before)
+        # About 1.1kB on CPython 3.11, most of which is the wrapper.
+        print("MEM", used / 200, len(deprecation._registry)); self.assertLess(used / 200, 1600)
+
+
+class Test_deprecate_class(unittest2.TestCase):
+
+    def setUp(self):
+        namespace = {}
+        exec(LEGACY_CLASS, namespace)
+        self.cls = namespace["Class"]
+        self.subclass = namespace["Subclass"]
+
+    def test_members(self):
+        deprecation.deprecate_class(self.cls, deprecated_in="1.0")
+        instance = _messages(self.cls)
+        self.assertEqual(instance[1], [])
+        instance = instance[0]
+
+        for get, value, name in [
+                (instance.method, "method", "method"),
+                (instance.class_method, self.cls, "class_method"),
+                (self.cls.class_method, self.cls, "class_method"),
+                (lambda: instance.static_method(1), 1, "static_method"),
+                (lambda: self.cls.static_method(1), 1, "static_method"),
+                (lambda: instance.attribute, "attribute", "attribute")]:
+            with self.subTest(name=name):
+                self.assertEqual(_messages(get),
+                                 (value, ["%s is deprecated as of 1.0." %
+                                          name]))
+        self.assertEqual(_messages(instance._private), ("private", []))
+
+    def test_already_deprecated(self):
+        for name in ["method", "class_method", "static_method",
+                     "attribute"]:
+            setattr(self.cls, name, deprecation.deprecated(
+                "1.0", details="already")(vars(self.cls)[name]))
+        deprecation.deprecate_class(self.cls, deprecated_in="2.0")
+        instance = self.cls()
+
+        for get in [instance.method, instance.class_method,
+                    lambda: instance.static_method(1),
+                    lambda: instance.attribute]:
+            messages = _messages(get)[1]
+            self.assertEqual(len(messages), 1)
+            self.assertIn("already", messages[0])
+
+    def test_subclasses(self):
+        deprecation.deprecate_class(self.cls, deprecated_in="1.0")
+        instance = self.subclass()
+
+        self.assertEqual(_messages(instance.other), ("other", []))
+        self.assertEqual(_messages(instance.method),
+                         ("method", ["method is deprecated as of 1.0."]))
+        self.assertEqual(_messages(self.subclass.class_method),
+                         (self.subclass,
+                          ["class_method is deprecated as of 1.0."]))
+
+
+class Test_policy(unittest2.TestCase):
+
+    def _count_warnings(self, fn, calls):
+        def call():
+            for _ in range(calls):
+                fn()
+        return len(_call(call)[1])
+
+    def test_always(self):
+        @deprecation.deprecated(policy="always")
+        def fn():
+            pass
+
+        self.assertEqual(self._count_warnings(fn, 5), 5)
+
+    def test_once(self):
+        @deprecation.deprecated(policy="once")
+        def fn():
+            pass
+
+        self.assertEqual(self._count_warnings(fn, 5), 1)
+        self.assertEqual(self._count_warnings(fn, 5), 0)
+
+    def test_callsite(self):
+        @deprecation.deprecated(policy="callsite")
+        def fn():
+            pass
+
+        def other_site():
+            fn()
+
+        self.assertEqual(self._count_warnings(fn, 5), 1)
+        self.assertEqual(self._count_warnings(other_site, 5), 1)
+
+    def test_every_nth(self):
+        @deprecation.deprecated(policy=deprecation.EveryNth(3))
+        def fn():
+            pass
+
+        self.assertEqual(self._count_warnings(fn, 7), 3)
+
+    def test_token_bucket(self):
+        @deprecation.deprecated(policy=deprecation.TokenBucket(0.001,
+                                                               burst=2))
+        def fn():
+            pass
+
+        self.assertEqual(self._count_warnings(fn, 5), 2)
+
+    def test_policy_state_is_per_function(self):
+        once = deprecation.deprecated(policy="once")
+
+        @once
+        def fn1():
+            pass
+
+        @once
+        def fn2():
+            pass
+
+        self.assertEqual(self._count_warnings(fn1, 2), 1)
+        self.assertEqual(self._count_warnings(fn2, 2), 1)
+
+    def test_unknown_policy(self):
+        for policy in ["sometimes", None, []]:
+            with self.subTest(policy=policy):
+                self.assertRaises(ValueError, deprecation.deprecated,
+                                  policy=policy)
+
+    def test_allow_not_overridden(self):
+        class Incomplete(deprecation.Policy):
+            pass
+
+        for policy in [deprecation.Policy(), Incomplete()]:
+            with self.subTest(policy=type(policy).__name__):
+                self.assertRaises(TypeError, deprecation.deprecated,
+                                  policy=policy)
+
+    def test_invalid_arguments(self):
+        self.assertRaises(ValueError, deprecation.EveryNth, 0)
+        self.assertRaises(ValueError, deprecation.TokenBucket, 0)
+
+
+class Test_ignore_callers(unittest2.TestCase):
+
+    def _count_warnings(self, fn, module):
+        namespace = {"__name__": module, "fn": fn}
+        return len(_call(eval, "fn()", namespace)[1])
+
+    def test_ignore_callers(self):
+        @deprecation.deprecated(ignore_callers=["mypackage", "other.sub"])
+        def fn():
+            pass
+
+        for module, expected in [("mypackage", 0), ("mypackage.utils", 0),
+                                 ("mypackage_extra", 1), ("other", 1),
+                                 ("other.sub.module", 0), ("client", 1)]:
+            with self.subTest(module=module):
+                self.assertEqual(self._count_warnings(fn, module), expected)
+
+    def test_single_name(self):
+        @deprecation.deprecated(ignore_callers="mypackage")
+        def fn():
+            pass
+
+        self.assertEqual(self._count_warnings(fn, "mypackage.utils"), 0)
+        self.assertEqual(self._count_warnings(fn, "client"), 1)
+
+    def _record(self, fn):
+        qualname = getattr(fn, "__qualname__", fn.__name__)
+        for record in list(deprecation._registry):
+            if record.qualname == qualname and record.module == __name__:
+                return record
+
+    def test_ignored_calls_are_counted(self):
+        @deprecation.deprecated(ignore_callers=["mypackage"])
+        def ignored_counted():
+            pass
+
+        before = self._record(ignored_counted).calls
+        self._count_warnings(ignored_counted, "mypackage")
+        self.assertEqual(self._record(ignored_counted).calls, before + 1)
+
+    def test_classification_is_cached_per_code_object(self):
+        @deprecation.deprecated(ignore_callers=["mypackage"])
+        def ignored_cached():
+            pass
+
+        def caller():
+            ignored_cached()
+
+        for _ in range(3):
+            self.assertEqual(len(_call(caller)[1]), 1)
+        ignored = self._record(ignored_cached).ignore_callers._ignored
+        self.assertEqual(ignored,
+                         {id(caller.__code__): (caller.__code__, False)})
+
+
+class Test_usage(unittest2.TestCase):
+
+    def _qualname(self, fn):
+        return getattr(fn, "__qualname__", fn.__name__)
+
+    def _usage(self, fn, reset=False):
+        for entry in deprecation.usage(reset=reset):
+            if entry["qualname"] == self._qualname(fn):
+                return entry
+
+    def test_counts_calls(self):
+        @deprecation.deprecated(deprecated_in="1.0", removed_in="2.0",
+                                current_version="1.5", details="details")
+        def counted():
+            pass
+        fn = counted
+
+        self.addCleanup(setattr, deprecation, "emit_warnings",
+                        deprecation.emit_warnings)
+        deprecation.emit_warnings = False
+
+        self.assertEqual(self._usage(fn),
+                         {"module": __name__, "qualname": self._qualname(fn),
+                          "deprecated_in": "1.0", "removed_in": "2.0",
+                          "details": "details", "state": "deprecated",
+                          "calls": 0})
+        for _ in range(3):
+            fn()
+        self.assertEqual(self._usage(fn)["calls"], 3)
+
+    def test_state(self):
+        for args, state in [({"deprecated_in": "2.0",
+                              "current_version": "1.0"}, "pending"),
+                            ({"deprecated_in": "1.0",
+                              "current_version": "1.0"}, "deprecated"),
+                            ({"deprecated_in": "1.0", "removed_in": "2.0",
+                              "current_version": "2.0"}, "unsupported")]:
+            with self.subTest(args=args):
+                def fn():
+                    pass
+                # Python 2 has no __qualname__, so give each function a
+                # name that earlier tests' functions can't share.
+                fn.__name__ = fn.__qualname__ = "test_state_" + state
+                fn = deprecation.deprecated(**args)(fn)
+
+                self.assertEqual(self._usage(fn)["state"], state)
+
+    def test_reset(self):
+        @deprecation.deprecated(deprecated_in="2.0", current_version="1.0")
+        def reset():
+            pass
+        fn = reset
+
+        fn()
+        fn()
+        self.assertEqual(self._usage(fn, reset=True)["calls"], 2)
+        self.assertEqual(self._usage(fn)["calls"], 0)
+        fn()
+        deprecation.reset_usage()
+        self.assertEqual(self._usage(fn)["calls"], 0)
+        fn()
+        self.assertEqual(self._usage(fn)["calls"], 1)
+
+    def test_forgets_collected_functions(self):
+        import gc
+
+        @deprecation.deprecated()
+        def collected():
+            pass
+        fn = collected
+
+        qualname = self._qualname(fn)
+        del fn, collected
+        gc.collect()
+        self.assertNotIn(qualname, [entry["qualname"]
+                                    for entry in deprecation.usage()])
+
+    def test_registered_while_reading(self):
+        import weakref
+
+        registered = []
+
+        class Registry(weakref.WeakSet):
+            def __iter__(self):
+                for record in weakref.WeakSet.__iter__(self):
+                    # As if another thread deprecated a function part way
+                    # through, the first time only.
+                    if not registered:
+                        registered.append(deprecation.deprecated()(
+                            lambda: None))
+                    yield record
+
+        self.addCleanup(setattr, deprecation, "_registry",
+                        deprecation._registry)
+        deprecation._registry = Registry(deprecation._registry)
+
+        for read in (deprecation.usage, deprecation.reset_usage,
+                     deprecation.metrics):
+            with self.subTest(read=read.__name__):
+                del registered[:]
+                read()
+                self.assertEqual(len(registered), 1)
+
+
+class Test_sample_callers(unittest2.TestCase):
+
+    def setUp(self):
+        self.addCleanup(deprecation.sample_callers, 0)
+        self.addCleanup(deprecation.caller_samples, reset=True)
+        deprecation.caller_samples(reset=True)
+
+        @deprecation.deprecated(deprecated_in="2.0", current_version="1.0")
+        def fn():
+            pass
+        self.fn = fn
+
+    def call_fn(self, times):
+        for _ in range(times):
+            self.fn()
+
+    def test_off_by_default(self):
+        self.call_fn(5)
+        self.assertEqual(deprecation.caller_samples(), [])
+
+    def test_samples_every_nth_call(self):
+        deprecation.sample_callers(every=3)
+        self.call_fn(7)
+
+        samples = deprecation.caller_samples(reset=True)
+        self.assertEqual(len(samples), 1)
+        sample = samples[0]
+        self.assertEqual(sample["module"], __name__)
+        self.assertEqual(sample["qualname"],
+                         getattr(self.fn, "__qualname__", "fn"))
+        self.assertEqual(sample["caller_module"], __name__)
+        self.assertTrue(sample["caller_qualname"].endswith("call_fn"))
+        self.assertEqual(sample["samples"], 3)
+        self.assertEqual(deprecation.caller_samples(), [])
+
+    def test_max_sites(self):
+        deprecation.sample_callers(every=1, max_sites=1)
+        self.fn()
+        self.call_fn(2)
+
+        samples = deprecation.caller_samples()
+        self.assertEqual(len(samples), 1)
+        self.assertTrue(samples[0]["caller_qualname"].endswith("max_sites"))
+
+    def test_invalid_every(self):
+        self.assertRaises(ValueError, deprecation.sample_callers, -1)
+
 
 class Test_fail_if_not_removed(unittest2.TestCase):
 
@@ -267,3 +1329,836 @@ class Test_fail_if_not_removed(unittest2.TestCase):
     @deprecation.fail_if_not_removed
     def test_literal_DeprecatedWarning(self):
         self._deprecated_method()
+
+
+class Test_fail_on_unsupported(unittest2.TestCase):
+
+    @deprecation.deprecated(deprecated_in="1.0", current_version="2.0")
+    def _deprecated_method(self):
+        pass
+
+    @deprecation.deprecated(deprecated_in="1.0", removed_in="2.0",
+                            current_version="2.0", policy="once")
+    def _unsupported_method(self):
+        pass
+
+    def test_context_manager(self):
+        with self.assertRaises(AssertionError):
+            with deprecation.fail_on_unsupported() as messages:
+                self._unsupported_method()
+                self._unsupported_method()
+                self.assertEqual(
+                    messages, ["_unsupported_method is unsupported "
+                               "as of 2.0."] * 2)
+
+    def test_DeprecatedWarning_doesnt_fail(self):
+        with deprecation.fail_on_unsupported() as messages:
+            self._deprecated_method()
+        self.assertEqual(messages, [])
+
+    def test_decorator(self):
+        for decorator in [deprecation.fail_on_unsupported,
+                          deprecation.fail_on_unsupported()]:
+            with self.subTest(decorator=decorator):
+                @decorator
+                def fn():
+                    self._unsupported_method()
+
+                self.assertRaises(AssertionError, fn)
+
+    def test_nested(self):
+        with deprecation.fail_on_unsupported() as outer:
+            with self.assertRaises(AssertionError):
+                with deprecation.fail_on_unsupported():
+                    self._unsupported_method()
+        self.assertEqual(outer, [])
+
+    def test_other_threads_not_collected(self):
+        import threading
+
+        with deprecation.fail_on_unsupported() as messages:
+            thread = threading.Thread(target=self._unsupported_method)
+            thread.start()
+            thread.join()
+        self.assertEqual(messages, [])
+
+    def test_fixture(self):
+        fixture = deprecation.fail_on_unsupported_fixture()
+        messages = next(fixture)
+        self._unsupported_method()
+        self.assertEqual(len(messages), 1)
+        self.assertRaises(AssertionError, next, fixture)
+
+    @deprecation.fail_on_unsupported
+    def test_literal_DeprecatedWarning(self):
+        self._deprecated_method()
+
+
+class Test_scan(unittest2.TestCase):
+
+    def setUp(self):
+        self.directory = _temporary_directory(self)
+        self.cache = os.path.join(self.directory, "cache.json")
+
+    def write(self, name, source):
+        path = os.path.join(self.directory, name)
+        with open(path, "w") as f:
+            f.write(textwrap.dedent(source))
+        return path
+
+    def test_finds_decorated_functions_and_classes(self):
+        path = self.write("module.py", """\
+            import deprecation as dep
+            from deprecation import deprecated
+            from datetime import date
+
+            __version__ = "1.5"
+
+            @dep.deprecated("1.0", "2.0", __version__, details="Use g")
+            def f():
+                pass
+
+            class Outer(object):
+                @deprecated(deprecated_in="1.0", removed_in=date(2000, 1, 1))
+                def method(self):
+                    @deprecated("1.4")
+                    def inner():
+                        pass
+
+            @deprecated("2.0", current_version=__version__)
+            class Old(object):
+                pass
+
+            @other("1.0")
+            def not_deprecated():
+                pass
+            """)
+
+        results = deprecation.scan([self.directory], cache_file=None)
+
+        self.assertEqual(
+            [(r["file"], r["line"], r["qualname"], r["kind"], r["state"])
+             for r in results],
+            [(path, 7, "f", "function", "deprecated"),
+             (path, 12, "Outer.method", "function", "unsupported"),
+             (path, 14, "Outer.method.<locals>.inner", "function",
+              "deprecated"),
+             (path, 18, "Old", "class", "pending")])
+        self.assertEqual(results[0]["removed_in"], "2.0")
+        self.assertEqual(results[0]["details"], "Use g")
+        self.assertEqual(results[0]["current_version"], "1.5")
+        self.assertEqual(results[1]["removed_on"], "2000-01-01")
+
+    def test_current_version(self):
+        self.write("module.py", """\
+            import deprecation
+
+            @deprecation.deprecated("1.0", "2.0")
+            def f():
+                pass
+            """)
+
+        for current_version, state in [(None, "deprecated"),
+                                       ("0.5", "pending"),
+                                       ("1.0", "deprecated"),
+                                       ("2.0", "unsupported")]:
+            with self.subTest(current_version=current_version):
+                results = deprecation.scan([self.directory], current_version,
+                                           cache_file=None)
+                self.assertEqual(results[0]["state"], state)
+
+    def test_unresolved(self):
+        self.write("module.py", """\
+            import deprecation
+
+            @deprecation.deprecated(VERSION, "2.0", details=DETAILS)
+            def f():
+                pass
+
+            @deprecation.deprecated(**arguments)
+            def g():
+                pass
+            """)
+
+        results = deprecation.scan([self.directory], cache_file=None)
+
+        self.assertEqual(results[0]["unresolved"],
+                         ["deprecated_in", "details"])
+        self.assertEqual(results[1]["unresolved"], ["*"])
+        self.assertEqual([r["state"] for r in results], [None, None])
+
+    def test_cache(self):
+        path = self.write("module.py", """\
+            import deprecation
+
+            @deprecation.deprecated("1.0")
+            def f():
+                pass
+            """)
+        deprecation.scan([self.directory], cache_file=self.cache)
+        self.assertTrue(os.path.exists(self.cache))
+
+        # Unchanged files come from the cache without being parsed.
+        parsed = []
+        scan_source = deprecation._scan_source
+        self.addCleanup(setattr, deprecation, "_scan_source", scan_source)
+        deprecation._scan_source = lambda *args: (parsed.append(args) or
+                                                  scan_source(*args))
+        results = deprecation.scan([self.directory], cache_file=self.cache,
+                                   processes=1)
+        self.assertEqual(parsed, [])
+        self.assertEqual(results[0]["qualname"], "f")
+
+        with open(path, "a") as f:
+            f.write("\n@deprecation.deprecated('1.0')\ndef g():\n    pass\n")
+        results = deprecation.scan([self.directory], cache_file=self.cache,
+                                   processes=1)
+        self.assertEqual(len(parsed), 1)
+        self.assertEqual([r["qualname"] for r in results], ["f", "g"])
+
+    def test_no_cache_by_default(self):
+        self.write("example.py", """\
+            import deprecation
+
+            @deprecation.deprecated("1.0")
+            def f():
+                pass
+            """)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(self.directory)
+
+        self.assertEqual(len(deprecation.scan(["."], processes=1)), 1)
+        self.assertEqual(len(deprecation.find_callers(["."], processes=1)),
+                         1)
+        self.assertEqual(os.listdir("."), ["example.py"])
+
+    def test_syntax_error_skipped(self):
+        self.write("broken.py", "def (:\n")
+
+        errors = []
+        self.addCleanup(setattr, sys, "stderr", sys.stderr)
+        sys.stderr = type("Stderr", (object,), {"write": errors.append})()
+        results = deprecation.scan([self.directory], cache_file=None)
+
+        self.assertEqual(results, [])
+        self.assertEqual(len(errors), 1)
+
+    def test_main(self):
+        self.write("module.py", """\
+            import deprecation
+
+            @deprecation.deprecated("1.0")
+            def f():
+                pass
+            """)
+        output = os.path.join(self.directory, "report.csv")
+
+        deprecation.main(["scan", self.directory, "--no-cache", "-j", "1",
+                          "--format", "csv", "-o", output])
+
+        with open(output) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(lines[0].split(",")[:3], ["file", "line", "qualname"])
+        self.assertEqual(lines[1].split(",")[1:3], ["3", "f"])
+
+
+class Test_find_callers(unittest2.TestCase):
+
+    def setUp(self):
+        self.directory = _temporary_directory(self)
+        os.makedirs(os.path.join(self.directory, "pkg", "sub"))
+        self.write("pkg/__init__.py", "from .old import legacy\n")
+        self.write("pkg/sub/__init__.py", "")
+        self.write("pkg/old.py", """\
+            import deprecation
+            from datetime import date
+
+            @deprecation.deprecated("1.0", "2.0")
+            def legacy():
+                pass
+
+            class Old(object):
+                @deprecation.deprecated("1.0", date(2000, 1, 1))
+                def method(self):
+                    pass
+
+            @deprecation.deprecated("1.0")
+            def unused():
+                legacy()
+            """)
+
+    def write(self, name, source):
+        path = os.path.join(self.directory, *name.split("/"))
+        with open(path, "w") as f:
+            f.write(textwrap.dedent(source))
+        return path
+
+    def callers(self, results):
+        return dict((result["symbol"],
+                     [(os.path.relpath(caller["file"], self.directory),
+                       caller["line"], caller["scope"])
+                      for caller in result["callers"]])
+                    for result in results)
+
+    def test_callers(self):
+        self.write("pkg/sub/user.py", """\
+            from .. import legacy
+            from ..old import Old as O
+            import pkg.old
+
+            def run():
+                legacy()
+                O.method(None)
+                pkg.old.legacy()
+            """)
+
+        results = deprecation.find_callers([self.directory], cache_file=None)
+
+        # Ordered by removal date, then version, then not at all.
+        self.assertEqual([result["symbol"] for result in results],
+                         ["pkg.old.Old.method", "pkg.old.legacy",
+                          "pkg.old.unused"])
+        self.assertEqual(results[0]["state"], "unsupported")
+        user = os.path.join("pkg", "sub", "user.py")
+        self.assertEqual(self.callers(results), {
+            "pkg.old.Old.method": [(user, 7, "run")],
+            "pkg.old.legacy": [(os.path.join("pkg", "__init__.py"), 1,
+                                "<module>"),
+                               (os.path.join("pkg", "old.py"), 15, "unused"),
+                               (user, 1, "<module>"),
+                               (user, 6, "run"),
+                               (user, 8, "run")],
+            "pkg.old.unused": []})
+
+    def test_index_updated_from_changed_files(self):
+        cache = os.path.join(self.directory, "cache.json")
+        user = self.write("pkg/user.py", "import pkg\n")
+        results = deprecation.find_callers([self.directory],
+                                           cache_file=cache, processes=1)
+        self.assertEqual(self.callers(results)["pkg.old.unused"], [])
+
+        parsed = []
+        scan_source = deprecation._scan_source
+        self.addCleanup(setattr, deprecation, "_scan_source", scan_source)
+        deprecation._scan_source = lambda *args: (parsed.append(args[1]) or
+                                                  scan_source(*args))
+        with open(user, "a") as f:
+            f.write("pkg.old.unused()\n")
+        results = deprecation.find_callers([self.directory],
+                                           cache_file=cache, processes=1)
+
+        self.assertEqual(parsed, [os.path.normpath(user)])
+        self.assertEqual(self.callers(results)["pkg.old.unused"],
+                         [(os.path.join("pkg", "user.py"), 2, "<module>")])
+
+    def test_main(self):
+        output = os.path.join(self.directory, "report.csv")
+
+        deprecation.main(["callers", self.directory, "--no-cache", "-j", "1",
+                          "--format", "csv", "-o", output])
+
+        with open(output) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(lines[0], ",".join(deprecation._CALLER_FIELDS))
+        # One row for each caller, and one for the symbol that has none.
+        self.assertEqual([line.split(",")[0] for line in lines[1:]],
+                         ["pkg.old.Old.method", "pkg.old.legacy",
+                          "pkg.old.legacy", "pkg.old.unused"])
+
+
+class Test_sinks(unittest2.TestCase):
+
+    def setUp(self):
+        self.events = []
+        deprecation.add_sink(self.events.append)
+        self.addCleanup(deprecation.remove_sink, self.events.append)
+
+        @deprecation.deprecated("1.0", "2.0", "1.5", details="Use g")
+        def sunk():
+            pass
+        self.fn = sunk
+
+    def test_event(self):
+        self.addCleanup(setattr, deprecation, "_time", deprecation._time)
+        deprecation._time = lambda: 1234.5
+
+        with warnings.catch_warnings(record=True):
+            warnings.simplefilter("always")
+            self.fn()
+        line = sys._getframe().f_lineno - 1
+
+        self.assertEqual(len(self.events), 1)
+        event = self.events[0]
+        self.assertTrue(event.pop("qualname").endswith("sunk"))
+        self.assertTrue(event.pop("caller_qualname").endswith("test_event"))
+        self.assertEqual(event, {
+            "module": __name__, "deprecated_in": "1.0", "removed_in": "2.0",
+            "details": "Use g", "state": "deprecated",
+            "caller_module": __name__, "caller_lineno": line,
+            "timestamp": 1234.5})
+
+    def test_policy_applies(self):
+        @deprecation.deprecated("1.0", policy="once")
+        def once():
+            pass
+
+        _call(once)
+        _call(once)
+        self.assertEqual(len(self.events), 1)
+
+    def test_remove_sink(self):
+        deprecation.remove_sink(self.events.append)
+        deprecation.remove_sink(self.events.append)
+
+        _call(self.fn)
+        self.assertEqual(self.events, [])
+
+    def test_json_lines_handler(self):
+        import json
+
+        directory = _temporary_directory(self)
+        path = os.path.join(directory, "events.jsonl")
+
+        with deprecation.JsonLinesHandler(path) as handler:
+            deprecation.add_sink(handler)
+            for _ in range(3):
+                _call(self.fn)
+            handler.flush()
+            with open(path) as f:
+                self.assertEqual(len(f.readlines()), 3)
+        self.assertEqual(deprecation._sinks, (self.events.append,))
+
+        with open(path) as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual(records[0]["details"], "Use g")
+        self.assertEqual(handler.dropped, 0)
+
+    def test_json_lines_handler_drops_on_overflow(self):
+        directory = _temporary_directory(self)
+        handler = deprecation.JsonLinesHandler(
+            os.path.join(directory, "events.jsonl"), max_queued=1)
+        self.addCleanup(handler.close)
+        # A queue the writer isn't reading from fills up.
+        writing = handler._queue
+        handler._queue = writing.__class__(1)
+        for _ in range(3):
+            handler({})
+        handler._queue = writing
+        self.assertEqual(handler.dropped, 2)
+
+    def test_json_lines_handler_bad_path(self):
+        self.assertRaises((IOError, OSError), deprecation.JsonLinesHandler,
+                          os.path.join(os.path.dirname(__file__),
+                                       "missing", "events.jsonl"))
+
+    @unittest2.skipUnless(os.path.exists("/dev/full"), "needs /dev/full")
+    def test_json_lines_handler_write_fails(self):
+        # Writes to /dev/full fail as if the disk were full.
+        handler = deprecation.JsonLinesHandler("/dev/full")
+        for _ in range(3):
+            handler({})
+        handler.flush()
+        handler.close()
+        self.assertEqual(handler.dropped, 3)
+
+
+class Test_metrics(unittest2.TestCase):
+
+    def setUp(self):
+        @deprecation.deprecated("1.0", date(2000, 1, 1),
+                                details='Use "g"\n')
+        def metered():
+            pass
+        self.fn = metered
+
+    def count(self, text):
+        # Earlier tests' functions may still be around with the same
+        # labels, so only the changes in counts can be relied on.
+        for line in text.splitlines():
+            if "metered" in line:
+                return int(line.rsplit(" ", 1)[1])
+        return 0
+
+    def call(self, times):
+        for _ in range(times):
+            _call(self.fn)
+
+    def test_metrics(self):
+        before = self.count(deprecation.metrics())
+        self.call(2)
+
+        text = deprecation.metrics()
+
+        self.assertTrue(text.startswith(
+            "# HELP deprecated_calls Calls to deprecated functions.\n"
+            "# TYPE deprecated_calls counter\n"))
+        self.assertTrue(text.endswith("\n# EOF\n"))
+        self.assertIn(
+            'deprecated_calls_total{function="%s.%s",deprecated_in="1.0",'
+            'removed_in="2000-01-01",state="unsupported"} '
+            % (__name__, getattr(self.fn, "__qualname__", "metered")), text)
+        self.assertEqual(self.count(text), before + 2)
+
+    def test_not_reset_by_usage(self):
+        before = self.count(deprecation.metrics())
+        self.call(1)
+        deprecation.reset_usage()
+
+        self.assertEqual(self.count(deprecation.metrics()), before + 1)
+
+    def test_label_values_escaped(self):
+        self.assertEqual(deprecation._label_value('a"b\\c\nd'),
+                         'a\\"b\\\\c\\nd')
+
+    def test_serve_metrics(self):
+        try:
+            from urllib.request import urlopen
+        except ImportError:
+            from urllib2 import urlopen
+
+        server = deprecation.serve_metrics(0, "127.0.0.1")
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.call(1)
+
+        response = urlopen("http://127.0.0.1:%d/metrics"
+                           % server.server_address[1])
+        try:
+            body = response.read().decode("utf-8")
+            self.assertEqual(response.headers["Content-Type"],
+                             deprecation._OPENMETRICS_CONTENT_TYPE)
+        finally:
+            response.close()
+        self.assertEqual(body, deprecation.metrics())
+
+
+class Test_share_counters(unittest2.TestCase):
+
+    def setUp(self):
+        # Earlier tests' functions may still be around, so leave room for
+        # them as well.
+        self.shared = deprecation.share_counters(slots=256, interval=0)
+        self.addCleanup(self.shared.close)
+
+        @deprecation.deprecated("1.0", "2.0", "1.5")
+        def shared_fn():
+            pass
+        self.fn = shared_fn
+
+    def call(self, times):
+        for _ in range(times):
+            _call(self.fn)
+
+    def count(self):
+        for key, count in self.shared.totals().items():
+            if key[0].endswith("shared_fn"):
+                return count
+        return 0
+
+    def test_counts_published(self):
+        # Earlier tests' functions may still be around with the same
+        # labels, so only the changes in counts can be relied on.
+        before = self.count()
+        self.call(2)
+        self.assertEqual(self.count(), before + 2)
+        # Only what's new is added each time.
+        self.call(1)
+        self.assertEqual(self.count(), before + 3)
+        self.assertIn("shared_fn", deprecation.metrics())
+
+    @unittest2.skipUnless(hasattr(os, "fork"), "needs os.fork")
+    def test_forked_processes(self):
+        before = self.count()
+        self.call(1)
+        # Python 2 can't tell when a process forks.
+        self.shared.publish()
+
+        pid = os.fork()
+        if pid == 0:
+            try:
+                self.call(3)
+                self.shared.publish()
+            finally:
+                os._exit(0)
+        os.waitpid(pid, 0)
+
+        self.assertEqual(self.count(), before + 4)
+
+    @unittest2.skipUnless(hasattr(os, "fork"), "needs os.fork")
+    def test_killed_while_publishing(self):
+        before = self.count()
+        pid = os.fork()
+        if pid == 0:
+            # Exit without ever releasing the lock.
+            self.shared._lock.acquire(True, 1)
+            os._exit(0)
+        os.waitpid(pid, 0)
+
+        self.call(1)
+        self.assertTrue(self.shared.publish())
+        self.assertEqual(self.count(), before + 1)
+
+    def test_lock_arguments(self):
+        lock = self.shared._lock
+        self.assertTrue(lock.acquire())
+        try:
+            self.assertFalse(lock.acquire(False))
+            if sys.version_info >= (3,):
+                self.assertFalse(lock.acquire(True, 0.01))
+        finally:
+            lock.release()
+        self.assertTrue(lock.acquire(True, None))
+        lock.release()
+
+    def test_full(self):
+        shared = deprecation.share_counters(slots=1, interval=0)
+        self.addCleanup(shared.close)
+
+        @deprecation.deprecated("1.0")
+        def other():
+            pass
+
+        _call(self.fn)
+        _call(other)
+        self.assertEqual(len(shared.totals()), 1)
+
+
+@unittest2.skipIf(sys.version_info < (3, 7), "needs Python 3.7+")
+class Test_install_manifest(unittest2.TestCase):
+
+    def setUp(self):
+        self.directory = _temporary_directory(self)
+        sys.path.insert(0, self.directory)
+        self.addCleanup(sys.path.remove, self.directory)
+        with open(os.path.join(self.directory, "manifested.py"), "w") as f:
+            f.write(textwrap.dedent("""\
+                LIMIT = 10
+                DEFAULT_URL = "https://example.com/api"
+
+                def old():
+                    return 1
+
+                class Client(object):
+                    def connect(self):
+                        return 2
+
+                    @staticmethod
+                    def parse():
+                        return 3
+                """))
+        self.addCleanup(sys.modules.pop, "manifested", None)
+
+    def install(self, manifest, **kwargs):
+        finder = deprecation.install_manifest(manifest, **kwargs)
+
+        def uninstall():
+            # Tests that care about unapplied entries uninstall first.
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", RuntimeWarning)
+                finder.uninstall()
+        self.addCleanup(uninstall)
+        return finder
+
+    def test_applied_on_import(self):
+        import importlib
+
+        self.install({
+            "manifested.old": {"deprecated_in": "1.0", "removed_in": "2.0",
+                               "details": "Use new"},
+            "manifested:Client.connect": {"deprecated_in": "1.0"},
+            "manifested:Client.parse": {"deprecated_in": "1.0",
+                                        "removed_on": "2000-01-01"},
+            "manifested:LIMIT": {"deprecated_in": "1.0"}},
+            current_version="1.5")
+        module = importlib.import_module("manifested")
+
+        def use():
+            return (module.old(), module.Client().connect(),
+                    module.Client.parse(), module.LIMIT)
+
+        values, caught = _call(use)
+        self.assertEqual(values, (1, 2, 3, 10))
+        self.assertEqual([w.category for w in caught],
+                         [deprecation.DeprecatedWarning,
+                          deprecation.DeprecatedWarning,
+                          deprecation.UnsupportedWarning,
+                          deprecation.DeprecatedWarning])
+        self.assertIn("Use new", str(caught[0].message))
+
+    def test_string_constant(self):
+        import importlib
+
+        self.install({"manifested:DEFAULT_URL": {"deprecated_in": "1.0"}})
+        module = importlib.import_module("manifested")
+
+        self.assertEqual(_messages(getattr, module, "DEFAULT_URL"),
+                         ("https://example.com/api",
+                          ["DEFAULT_URL is deprecated as of 1.0."]))
+
+    def test_already_imported(self):
+        import importlib
+
+        module = importlib.import_module("manifested")
+        self.install({"manifested:old": {"deprecated_in": "1.0"}})
+
+        self.assertEqual(len(_call(module.old)[1]), 1)
+
+    def test_dotted_paths(self):
+        import importlib
+
+        finder = self.install({"manifested.Client.connect":
+                               {"deprecated_in": "1.0"}})
+        module = importlib.import_module("manifested")
+
+        self.assertEqual(_messages(module.Client().connect)[1],
+                         ["connect is deprecated as of 1.0."])
+        self.assertEqual(_messages(finder.uninstall)[1], [])
+
+    def test_dotted_path_in_package(self):
+        import importlib
+
+        package = os.path.join(self.directory, "manifested_package")
+        os.mkdir(package)
+        with open(os.path.join(package, "__init__.py"), "w") as f:
+            f.write("")
+        with open(os.path.join(package, "module.py"), "w") as f:
+            f.write("def old():\n    return 1\n")
+        self.addCleanup(sys.modules.pop, "manifested_package", None)
+        self.addCleanup(sys.modules.pop, "manifested_package.module", None)
+
+        self.install({"manifested_package.module.old":
+                      {"deprecated_in": "1.0"}})
+        module = importlib.import_module("manifested_package.module")
+        self.assertEqual(_messages(module.old),
+                         (1, ["old is deprecated as of 1.0."]))
+
+    def test_unapplied_entries_reported(self):
+        finder = self.install({"manifested.Client.missing": {},
+                               "never_imported:old": {}})
+        self.assertEqual(_messages(finder.uninstall)[1],
+                         ["manifest entries were never applied: "
+                          "manifested.Client.missing, never_imported:old"])
+
+    def test_other_modules_untouched(self):
+        finder = self.install({"manifested:old": {}})
+        self.assertIsNone(finder.find_spec("json", None))
+
+    def test_missing_name(self):
+        import importlib
+
+        self.install({"manifested:missing": {"deprecated_in": "1.0"}})
+        _, caught = _call(importlib.import_module, "manifested")
+        self.assertEqual(caught[0].category, RuntimeWarning)
+
+    def test_files(self):
+        manifests = [("json", '{"manifested:old": {"deprecated_in": "1.0", '
+                              '"removed_on": "2000-01-01"}}')]
+        try:
+            import tomllib  # noqa: F401
+        except ImportError:
+            pass
+        else:
+            manifests.append(("toml", '["manifested:old"]\n'
+                                      'deprecated_in = "1.0"\n'
+                                      'removed_on = 2000-01-01\n'))
+        for suffix, text in manifests:
+            with self.subTest(suffix=suffix):
+                path = os.path.join(self.directory, "manifest." + suffix)
+                with open(path, "w") as f:
+                    f.write(text)
+                self.assertEqual(deprecation._load_manifest(path), {
+                    "manifested": [["manifested:old", set(["manifested"]),
+                                    {"deprecated_in": "1.0",
+                                     "removed_in": date(2000, 1, 1)}]]})
+
+    def test_invalid(self):
+        for manifest in [{"manifested": {}},
+                         {"manifested:old": {"removed": "2.0"}},
+                         {"manifested:old": {"removed_in": "2.0"}},
+                         {"manifested:old": {"removed_in": "2.0",
+                                             "removed_on": "2000-01-01"}}]:
+            with self.subTest(manifest=manifest):
+                self.assertRaises((ValueError, TypeError),
+                                  deprecation.install_manifest, manifest)
+
+
+class Test_ReleasePlan(unittest2.TestCase):
+
+    deprecations = [
+        {"qualname": "a", "deprecated_in": "1.0", "removed_in": "2.0"},
+        {"qualname": "b", "deprecated_in": "1.5", "removed_in": None},
+        {"qualname": "c", "deprecated_in": "2.0rc1", "removed_in": "3.0"},
+        {"qualname": "d", "deprecated_in": "1.0", "removed_in": None,
+         "removed_on": "2030-01-01"},
+        {"qualname": "e", "deprecated_in": "1.0",
+         "removed_in": date(2031, 1, 1)},
+        {"qualname": "f", "deprecated_in": None, "removed_in": None,
+         "unresolved": ["deprecated_in"]},
+        {"qualname": "g", "deprecated_in": "not a version",
+         "removed_in": None}]
+
+    def changes(self, *args, **kwargs):
+        plan = deprecation.ReleasePlan(self.deprecations)
+        return [(change["qualname"], change["before"], change["after"])
+                for change in plan.changes(*args, **kwargs)]
+
+    def test_versions(self):
+        for args, changes in [
+                (("0.5", "1.0"), [("a", "pending", "deprecated")]),
+                (("1.0", "1.5"), [("b", "pending", "deprecated")]),
+                (("1.5", "2.0"), [("a", "deprecated", "unsupported"),
+                                  ("c", "pending", "deprecated")]),
+                (("2.0", "1.5"), [("a", "unsupported", "deprecated"),
+                                  ("c", "deprecated", "pending")]),
+                (("1.1", "1.4"), []),
+                (("1.0", "3.0"), [("a", "deprecated", "unsupported"),
+                                  ("b", "pending", "deprecated"),
+                                  ("c", "pending", "unsupported")])]:
+            with self.subTest(args=args):
+                self.assertEqual(self.changes(*args, old_date="2020-01-01"),
+                                 changes)
+
+    def test_agrees_with_deprecated(self):
+        plan = deprecation.ReleasePlan(self.deprecations[:3])
+        names = {(False, False): "pending", (True, False): "deprecated",
+                 (False, True): "unsupported"}
+        for version in ["0.1", "1.0", "1.7", "2.0rc1", "2.0", "3.0"]:
+            # Everything is pending at 0.0, so whatever hasn't changed
+            # since then still is.
+            after = dict((change["qualname"], change["after"])
+                         for change in plan.changes("0.0", version))
+            for d in self.deprecations[:3]:
+                with self.subTest(version=version, qualname=d["qualname"]):
+                    state = deprecation._version_state(
+                        d["deprecated_in"], d["removed_in"], version)
+                    self.assertEqual(after.get(d["qualname"], "pending"),
+                                     names[state])
+
+    def test_dates(self):
+        self.assertEqual(self.changes(old_date="2029-12-31",
+                                      new_date=date(2030, 1, 1)),
+                         [("d", "deprecated", "unsupported")])
+        self.assertEqual(self.changes(old_date="2029-01-01",
+                                      new_date="2032-01-01"),
+                         [("d", "deprecated", "unsupported"),
+                          ("e", "deprecated", "unsupported")])
+        self.assertEqual(self.changes(old_date="2029-01-01"), [])
+
+    def test_from_scan_and_main(self):
+        directory = _temporary_directory(self)
+        with open(os.path.join(directory, "module.py"), "w") as f:
+            f.write("import deprecation\n\n"
+                    "@deprecation.deprecated('1.0', '2.0')\n"
+                    "def f():\n    pass\n")
+        output = os.path.join(directory, "plan.csv")
+
+        deprecation.main(["plan", directory, "--no-cache", "-j", "1",
+                          "--from", "1.5", "--to", "2.0", "--format", "csv",
+                          "-o", output])
+
+        with open(output) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(lines[0], ",".join(deprecation._PLAN_FIELDS))
+        self.assertEqual(lines[1].split(",")[2:],
+                         ["f", "1.0", "2.0", "", "deprecated",
+                          "unsupported"])